@@ -1,10 +1,21 @@
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-import os
-import google.generativeai as genai
 from dotenv import load_dotenv
-import json
 import traceback
+from backends import open_backend
+from export import ExportCache, ExportOptions, export_etag, export_key
+from generation import InvalidRequest, generate_description, modify_fields
+from metrics import RequestTimer, registry
+from patches import modify_texts
+from projects import RevisionConflict, UnknownProject, open_project_store, project_saver, resolve_modify_request
+from response_cache import ResponseCache, cache_key, replay
+from resumable import StreamExpired, StreamRegistry, UnknownStream, last_event_id
+from scheduler import Overloaded, Scheduler, admitted_events, client_id
+from sectioned import generate_events
+from similar_prompts import SimilarPrompts, reuse_similar
+from single_flight import SingleFlight
+from sse_output import OutputOptions, encode_stream
+from streaming import section_events
 
 load_dotenv()
 
@@ -14,93 +25,104 @@ CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:3000"],
         "methods": ["GET", "POST"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "Last-Event-ID"],
+        "expose_headers": ["X-Stream-Id", "Retry-After"]
     }
 })
 
-# Initialize Gemini client with error handling
+# Initialize the model backend (MODEL_BACKEND=gemini|fake) with error handling
 try:
-    api_key = os.getenv('GOOGLE_API_KEY')
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables")
-
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.5-flash-preview-04-17')
+    backend = open_backend()
 except Exception as e:
-    print(f"Error initializing Gemini client: {str(e)}")
+    print(f"Error initializing model backend: {str(e)}")
     traceback.print_exc()
 
-def stream_response(response):
-    try:
-        for chunk in response:
-            if hasattr(chunk, 'text'):
-                yield f"data: {json.dumps({'text': chunk.text})}\n\n"
-    except Exception as e:
-        print(f"Error in stream_response: {str(e)}")
-        traceback.print_exc()
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+response_cache = ResponseCache.from_env()
+flights = SingleFlight()
+# PROJECT_STORE=memory|sqlite|filesystem; the memory store keeps the
+# PROJECT_STORE_MAX most recently used projects
+projects = open_project_store()
+output_options = OutputOptions.from_env()
+# Generations keep running for RESUME_GRACE_S after the client drops, so a
+# reconnect to /api/streams/<id> with Last-Event-ID picks up where it left off
+streams = StreamRegistry.from_env()
+# Model calls wait here for a slot (MAX_ACTIVE_GENERATIONS, per client
+# MAX_GENERATIONS_PER_CLIENT); a full queue is answered with 429. Clients
+# are keyed by address; set TRUSTED_PROXIES to the number of proxies in
+# front of us to take it from X-Forwarded-For instead
+scheduler = Scheduler.from_env()
+# SIMILAR_PROMPTS=serve|modify reuses sites generated for near-identical
+# descriptions (SIMILAR_PROMPTS_THRESHOLD, persisted to SIMILAR_PROMPTS_PATH);
+# SIMILAR_PROMPTS_MAX bounds the index and defaults to PROJECT_STORE_MAX
+similar = SimilarPrompts.from_env()
+# Finished ZIP exports by project revision (EXPORT_CACHE_ENTRIES, EXPORT_CACHE_MAX_BYTES)
+exports = ExportCache.from_env()
+
+def generation_texts(prompt, timer):
+    # Replay a cached generation when we have one, join an identical one that
+    # is still streaming, and only otherwise open a new upstream stream
+    key = cache_key(prompt, backend.model_name, backend.settings)
+    cached = response_cache.get(key)
+    if cached is not None:
+        timer.prompt(prompt, source='cache')
+        return replay(cached)
+    timer.prompt(prompt)
+
+    def start():
+        return response_cache.record(key, backend.stream(prompt))
+
+    return flights.stream(key, start)
+
+def admit(open_events, timer):
+    ticket = scheduler.admit(client_id(
+        request.headers.get('X-Forwarded-For'), request.remote_addr, scheduler.trusted_proxies))
+    stream = streams.open(admitted_events(scheduler, ticket, open_events, timer))
+    # A client that drops while queued gives up its place once the grace runs out
+    ticket.abandoned = stream.abandoned
+    return stream
+
+def overloaded(e):
+    return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+def sse_response(stream, last_seq=0):
+    events = stream.follow(last_seq)
+    encoding = output_options.negotiate(request.headers.get('Accept-Encoding'))
+    response = Response(
+        encode_stream(events, output_options, encoding),
+        mimetype='text/event-stream',
+        headers={**output_options.headers(encoding), 'X-Stream-Id': stream.stream_id}
+    )
+    # The encoder may be blocked waiting for the next event when the client
+    # goes, so detach it here rather than at that event
+    response.call_on_close(events.close)
+    return response
 
 @app.route('/api/generate-website', methods=['POST'])
 def generate_website():
+    timer = RequestTimer('generate')
     try:
         data = request.json
-        if not data:
-            return jsonify({'error': 'No JSON data received'}), 400
-
-        description = data.get('description')
-        if not description:
-            return jsonify({'error': 'No description provided'}), 400
+        description = generate_description(data)
 
         print(f"Received description: {description}")  # Debug log
 
-        # Prompt engineering for website generation
-        prompt = f"""
-        Create a visually appealing, professional website based on this description: {description}
-        
-        Important requirements:
-        1. Include a gradient animated background that smoothly transitions between colors
-        2. Use modern CSS features including animations, transitions, and flexbox/grid layouts
-        3. Make the design visually striking with proper spacing, typography, and color harmony
-        4. Include placeholder images with proper styling (use lorem picsum or unsplash source URLs)
-        5. Ensure the website is fully responsive and mobile-friendly
-        6. Add subtle animations for UI elements (buttons, links, sections) to enhance user experience
-        
-        Return only the HTML, CSS, and JavaScript code without any explanations.
-        Format the response exactly as:
-        ```html
-        [HTML code here]
-        ```
-        ```css
-        [CSS code here]
-        ```
-        ```javascript
-        [JavaScript code here]
-        ```
-        Make sure the code is complete, functional, and properly handles user interactions.
-        The JavaScript code should be properly scoped and not interfere with the parent window.
-        """
-
-        print("Sending request to Gemini...")  # Debug log
-
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.8,
-                top_p=0.9,
-                top_k=40,
-                max_output_tokens=8192,
-            ),
-            stream=True
-        )
-
-        print("Received response from Gemini")  # Debug log
-
-        return Response(
-            stream_response(response),
-            mimetype='text/event-stream'
-        )
-
+        open_texts = lambda prompt: generation_texts(prompt, timer)
+        reuse, on_complete = reuse_similar(similar, projects, description)
+        if reuse is not None:
+            if reuse.instant:
+                return sse_response(streams.open(reuse.events(open_texts, on_complete, timer)))
+            return sse_response(admit(lambda: reuse.events(open_texts, on_complete, timer), timer))
+
+        # Prompt engineering for website generation; mode=sectioned writes
+        # the HTML, CSS and JS concurrently from a shared plan
+        return sse_response(admit(lambda: generate_events(data, open_texts, on_complete, timer), timer))
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except Overloaded as e:
+        return overloaded(e)
     except Exception as e:
+        timer.finish('error', e)
         print(f"Error in generate_website: {str(e)}")
         traceback.print_exc()
         return jsonify({
@@ -110,77 +132,32 @@ def generate_website():
 
 @app.route('/api/modify-website', methods=['POST'])
 def modify_website():
+    timer = RequestTimer('modify')
     try:
-        data = request.json
-        if not data:
-            return jsonify({'error': 'No JSON data received'}), 400
-
-        modification = data.get('modificationDescription')
-        current_html = data.get('currentHtml')
-        current_css = data.get('currentCss')
-        current_js = data.get('currentJs', '')  # Optional JavaScript code
-
-        if not all([modification, current_html, current_css]):
-            return jsonify({'error': 'Missing required fields'}), 400
-
-        prompt = f"""
-        Modify this website according to this description: {modification}
-
-        Important:
-        1. Maintain or enhance any existing animations and visual effects
-        2. Ensure all gradient animations and visual styling remain intact
-        3. Keep the design modern, responsive and visually appealing
-        4. If adding new elements, match the existing style and add appropriate animations
-        5. Use high-quality placeholder images where needed (lorem picsum or unsplash URLs)
-        6. Ensure all interactive elements have proper hover/focus states
-
-        Current HTML:
-        ```html
-        {current_html}
-        ```
-
-        Current CSS:
-        ```css
-        {current_css}
-        ```
-
-        Current JavaScript:
-        ```javascript
-        {current_js}
-        ```
-
-        Return only the modified HTML, CSS, and JavaScript code without any explanations.
-        Format the response exactly as:
-        ```html
-        [Modified HTML code here]
-        ```
-        ```css
-        [Modified CSS code here]
-        ```
-        ```javascript
-        [Modified JavaScript code here]
-        ```
-        Make sure the code is complete, functional, and properly handles user interactions.
-        The JavaScript code should be properly scoped and not interfere with the parent window.
-        """
-
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.8,
-                top_p=0.9,
-                top_k=40,
-                max_output_tokens=8192,
-            ),
-            stream=True
-        )
-
-        return Response(
-            stream_response(response),
-            mimetype='text/event-stream'
-        )
-
+        # Requests with a projectId send only the instruction; the code comes
+        # from the stored base revision
+        data, project_id, base_revision = resolve_modify_request(
+            projects, request.json, request.headers.get('If-Match'))
+
+        modify_fields(data)
+
+        # mode=patch asks the model for SEARCH/REPLACE edits instead of full files
+        def open_events():
+            texts = modify_texts(data, lambda prompt: generation_texts(prompt, timer))
+            return section_events(texts, project_saver(projects, data, project_id, base_revision), timer)
+
+        return sse_response(admit(open_events, timer))
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except Overloaded as e:
+        return overloaded(e)
+    except UnknownProject:
+        return jsonify({'error': 'Unknown project'}), 404
+    except RevisionConflict as e:
+        return jsonify({'error': 'Project has changed since baseRevision', 'revision': e.head}), 409, {'ETag': f'"{e.head}"'}
     except Exception as e:
+        timer.finish('error', e)
         print(f"Error in modify_website: {str(e)}")
         traceback.print_exc()
         return jsonify({
@@ -188,5 +165,61 @@ def modify_website():
             'traceback': traceback.format_exc()
         }), 500
 
+@app.route('/api/streams/<stream_id>', methods=['GET'])
+def resume_stream(stream_id):
+    try:
+        return sse_response(streams.get(stream_id), last_event_id(request.headers.get('Last-Event-ID')))
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except UnknownStream:
+        return jsonify({'error': 'Unknown stream'}), 404
+    except StreamExpired:
+        return jsonify({'error': 'Events after Last-Event-ID are no longer buffered'}), 410
+
+@app.route('/api/projects/<project_id>', methods=['GET'])
+def get_project(project_id):
+    try:
+        revision = projects.head(project_id)
+        etag = f'"{revision}"'
+        if request.headers.get('If-None-Match') == etag:
+            return '', 304, {'ETag': etag}
+
+        return jsonify({'projectId': project_id, 'revision': revision, **projects.get(project_id, revision)}), 200, {'ETag': etag}
+
+    except UnknownProject:
+        return jsonify({'error': 'Unknown project'}), 404
+
+@app.route('/api/projects/<project_id>/export', methods=['GET'])
+def export_project(project_id):
+    # ?minify=1&prune=1&inline=0 by default; ?revision= exports an older revision
+    try:
+        options = ExportOptions.from_query(request.args)
+        # Resolved first, so a 304 is only ever sent for a revision that exists
+        revision = projects.revision(project_id, request.args.get('revision') or None)
+        etag = export_etag(revision, options)
+        if request.headers.get('If-None-Match') == etag:
+            return '', 304, {'ETag': etag}
+
+        chunks, size = exports.open(
+            export_key(project_id, revision, options), lambda: projects.get(project_id, revision), options)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+            'Content-Disposition': 'attachment; filename="website-code.zip"',
+        }
+        if size is not None:
+            headers['Content-Length'] = str(size)
+        return Response(chunks, mimetype='application/zip', headers=headers)
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except UnknownProject:
+        return jsonify({'error': 'Unknown project'}), 404
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(port=3001, debug=True)
\ No newline at end of file
@@ -0,0 +1,287 @@
+# Async (ASGI) serving mode for the streaming endpoints.
+#
+# Same routes and event format as app.py, but each open SSE stream is a
+# coroutine waiting on the backend's async streaming client instead of a
+# blocked worker thread, so one process can hold hundreds of streams open.
+#
+#   hypercorn async_app:app --bind 0.0.0.0:3001
+#
+# MAX_CONCURRENT_STREAMS (default 250) caps the number of generations one
+# process streams at a time; requests beyond it get a 503 with Retry-After
+# so a load balancer can send them elsewhere. The default is what one
+# process sustained on a single vCPU, with the load generator on the same
+# core and the fake backend's defaults (0.5s to first chunk, ~2.4s
+# per stream unloaded), in bench/loadtest.py bursts:
+#
+#   streams   ttfe p50   ttfe p95   duration p50
+#        10      0.59s      0.60s          2.38s
+#       250      0.87s  0.94-1.80s   2.81-2.87s
+#       400  0.96-1.19s 1.96-2.12s   3.21-3.63s
+#       500  1.40-2.08s 2.16-2.45s   4.08-4.43s
+#      1000  2.43-2.79s 3.63-3.93s   6.53-7.24s
+#
+# Every stream completed at every level; past ~250 the serving layer itself
+# adds seconds to each stream. Rerun it on the target machine and raise the
+# limit to match; MODEL_BACKEND=fake takes Gemini out of the measurement.
+#
+# As in app.py, generations carry on for RESUME_GRACE_S after a client drops
+# and can be resumed from /api/streams/<id> with Last-Event-ID. Only attached
+# clients count towards the stream limit.
+#
+# Model calls themselves go through the same scheduler as app.py
+# (MAX_ACTIVE_GENERATIONS, MAX_GENERATIONS_PER_CLIENT, MAX_QUEUED_GENERATIONS,
+# TRUSTED_PROXIES):
+# queued requests get their position as SSE events, and a full queue is
+# answered with 429.
+#
+# Project exports (/api/projects/<id>/export) are built and cached as in
+# app.py; the ZIP is handed to the loop a chunk at a time while it is built.
+from quart import Quart, request, jsonify, Response
+from quart_cors import cors
+import os
+from dotenv import load_dotenv
+import traceback
+from backends import open_backend
+from export import ExportCache, ExportOptions, chunks_async, export_etag, export_key
+from generation import InvalidRequest, generate_description, modify_fields
+from metrics import RequestTimer, registry
+from patches import modify_texts_async
+from projects import RevisionConflict, UnknownProject, open_project_store, project_saver, resolve_modify_request
+from response_cache import ResponseCache, cache_key, replay_async
+from resumable import AsyncStreamRegistry, StreamExpired, UnknownStream, last_event_id
+from scheduler import AsyncScheduler, Overloaded, admitted_events_async, client_id
+from sectioned import generate_events_async
+from similar_prompts import SimilarPrompts, reuse_similar
+from single_flight import AsyncSingleFlight
+from sse_output import OutputOptions, encode_stream_async
+from streaming import section_events_async
+
+load_dotenv()
+
+MAX_CONCURRENT_STREAMS = int(os.getenv('MAX_CONCURRENT_STREAMS', '250'))
+
+app = Quart(__name__)
+# Generations run for up to a minute; don't cut streaming bodies off
+app.config['RESPONSE_TIMEOUT'] = None
+app = cors(
+    app,
+    allow_origin=["http://localhost:3000"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Last-Event-ID"],
+    expose_headers=["X-Stream-Id", "Retry-After"],
+)
+
+# Initialize the model backend (MODEL_BACKEND=gemini|fake) with error handling
+try:
+    backend = open_backend()
+except Exception as e:
+    print(f"Error initializing model backend: {str(e)}")
+    traceback.print_exc()
+
+response_cache = ResponseCache.from_env()
+flights = AsyncSingleFlight()
+projects = open_project_store()
+output_options = OutputOptions.from_env()
+streams = AsyncStreamRegistry.from_env()
+scheduler = AsyncScheduler.from_env()
+similar = SimilarPrompts.from_env()
+exports = ExportCache.from_env()
+
+# Everything runs on one event loop, so a plain counter is enough
+active_streams = 0
+
+
+def streams_exhausted():
+    return jsonify({'error': 'Server is at its concurrent stream limit'}), 503, {'Retry-After': '5'}
+
+
+async def release_when_done(stream):
+    global active_streams
+    try:
+        async for event in stream:
+            yield event
+    finally:
+        active_streams -= 1
+
+
+async def generation_texts(prompt, timer):
+    key = cache_key(prompt, backend.model_name, backend.settings)
+    cached = response_cache.get(key)
+    if cached is not None:
+        timer.prompt(prompt, source='cache')
+        return replay_async(cached)
+    timer.prompt(prompt)
+
+    async def start():
+        return response_cache.record_async(key, await backend.stream_async(prompt))
+
+    return await flights.stream(key, start)
+
+
+def open_stream(open_events, timer):
+    # open_events runs once the scheduler grants a slot, inside the stream
+    global active_streams
+    ticket = scheduler.admit(client_id(
+        request.headers.get('X-Forwarded-For'), request.remote_addr, scheduler.trusted_proxies))
+    active_streams += 1
+    stream = streams.open(admitted_events_async(scheduler, ticket, open_events, timer))
+    # A client that drops while queued gives up its place once the grace runs out
+    ticket.abandoned = stream.abandoned
+    return sse_response(stream)
+
+
+def overloaded(e):
+    return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+
+def sse_response(stream, last_seq=0):
+    # The caller has already taken a slot in active_streams
+    global active_streams
+    try:
+        events = stream.follow(last_seq)
+    except Exception:
+        active_streams -= 1
+        raise
+
+    encoding = output_options.negotiate(request.headers.get('Accept-Encoding'))
+    return Response(
+        release_when_done(encode_stream_async(events, output_options, encoding)),
+        mimetype='text/event-stream',
+        headers={**output_options.headers(encoding), 'X-Stream-Id': stream.stream_id}
+    )
+
+
+@app.route('/api/generate-website', methods=['POST'])
+async def generate_website():
+    global active_streams
+    timer = RequestTimer('generate')
+    try:
+        data = await request.get_json()
+        description = generate_description(data)
+        if active_streams >= MAX_CONCURRENT_STREAMS:
+            return streams_exhausted()
+
+        open_texts = lambda prompt: generation_texts(prompt, timer)
+        reuse, on_complete = reuse_similar(similar, projects, description)
+        if reuse is not None:
+            if reuse.instant:
+                active_streams += 1
+                return sse_response(streams.open(await reuse.events_async(open_texts, on_complete, timer)))
+            return open_stream(lambda: reuse.events_async(open_texts, on_complete, timer), timer)
+        return open_stream(lambda: generate_events_async(data, open_texts, on_complete, timer), timer)
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except Overloaded as e:
+        return overloaded(e)
+    except Exception as e:
+        timer.finish('error', e)
+        print(f"Error in generate_website: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/api/modify-website', methods=['POST'])
+async def modify_website():
+    timer = RequestTimer('modify')
+    try:
+        data, project_id, base_revision = resolve_modify_request(
+            projects, await request.get_json(), request.headers.get('If-Match'))
+        modify_fields(data)
+        if active_streams >= MAX_CONCURRENT_STREAMS:
+            return streams_exhausted()
+
+        async def open_events():
+            texts = await modify_texts_async(data, lambda prompt: generation_texts(prompt, timer))
+            return section_events_async(texts, project_saver(projects, data, project_id, base_revision), timer)
+
+        return open_stream(open_events, timer)
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except Overloaded as e:
+        return overloaded(e)
+    except UnknownProject:
+        return jsonify({'error': 'Unknown project'}), 404
+    except RevisionConflict as e:
+        return jsonify({'error': 'Project has changed since baseRevision', 'revision': e.head}), 409, {'ETag': f'"{e.head}"'}
+    except Exception as e:
+        timer.finish('error', e)
+        print(f"Error in modify_website: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/api/streams/<stream_id>', methods=['GET'])
+async def resume_stream(stream_id):
+    global active_streams
+    try:
+        stream = streams.get(stream_id)
+        last_seq = last_event_id(request.headers.get('Last-Event-ID'))
+        if active_streams >= MAX_CONCURRENT_STREAMS:
+            return streams_exhausted()
+        active_streams += 1
+        return sse_response(stream, last_seq)
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except UnknownStream:
+        return jsonify({'error': 'Unknown stream'}), 404
+    except StreamExpired:
+        return jsonify({'error': 'Events after Last-Event-ID are no longer buffered'}), 410
+
+
+@app.route('/api/projects/<project_id>', methods=['GET'])
+async def get_project(project_id):
+    try:
+        revision = projects.head(project_id)
+        etag = f'"{revision}"'
+        if request.headers.get('If-None-Match') == etag:
+            return '', 304, {'ETag': etag}
+
+        return jsonify({'projectId': project_id, 'revision': revision, **projects.get(project_id, revision)}), 200, {'ETag': etag}
+
+    except UnknownProject:
+        return jsonify({'error': 'Unknown project'}), 404
+
+
+@app.route('/api/projects/<project_id>/export', methods=['GET'])
+async def export_project(project_id):
+    try:
+        options = ExportOptions.from_query(request.args)
+        # Resolved first, so a 304 is only ever sent for a revision that exists
+        revision = projects.revision(project_id, request.args.get('revision') or None)
+        etag = export_etag(revision, options)
+        if request.headers.get('If-None-Match') == etag:
+            return '', 304, {'ETag': etag}
+
+        chunks, size = exports.open(
+            export_key(project_id, revision, options), lambda: projects.get(project_id, revision), options)
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+            'Content-Disposition': 'attachment; filename="website-code.zip"',
+        }
+        if size is not None:
+            headers['Content-Length'] = str(size)
+        return Response(chunks_async(chunks), mimetype='application/zip', headers=headers)
+
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except UnknownProject:
+        return jsonify({'error': 'Unknown project'}), 404
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+if __name__ == '__main__':
+    app.run(port=3001)
@@ -0,0 +1,86 @@
+import os
+from generation import MODEL_NAME, GENERATION_SETTINGS
+from streaming import chunk_texts, chunk_texts_async
+
+
+class ModelBackend:
+    """Source of streamed model output for a prompt.
+
+    ``stream`` returns an iterator of text chunks and ``stream_async`` an
+    async iterator. Opening may be lazy: an upstream refusal can raise from
+    the first iteration rather than from opening (it does with Gemini), and
+    then reaches the client as an ``error`` event instead of an HTTP error.
+    Lazy opening is what lets several streams be opened first and read
+    concurrently. ``model_name`` and ``settings`` feed the response cache key.
+    """
+
+    model_name = None
+    settings = GENERATION_SETTINGS
+
+    def stream(self, prompt):
+        raise NotImplementedError
+
+    async def stream_async(self, prompt):
+        raise NotImplementedError
+
+
+class GeminiBackend(ModelBackend):
+    """Gemini through google-genai.
+
+    The SDK is imported here rather than at module level so processes that
+    never talk to Gemini (the fake backend, cold serverless instances
+    answering preflights) don't pay for it. One instance should live for the
+    life of the process: the client keeps a pooled HTTP connection to the
+    API alive between requests, and the request config is validated once.
+    """
+
+    def __init__(self, api_key, model_name=MODEL_NAME, settings=GENERATION_SETTINGS):
+        from google import genai
+        from google.genai import types
+
+        self.client = genai.Client(api_key=api_key)
+        self.model_name = model_name
+        self.settings = settings
+        self.config = types.GenerateContentConfig(**settings)
+
+    def stream(self, prompt):
+        # A generator: the request goes out, and any refusal raises, on the
+        # first next(), not here
+        response = self.client.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt,
+            config=self.config
+        )
+        return chunk_texts(response)
+
+    async def stream_async(self, prompt):
+        response = await self.client.aio.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt,
+            config=self.config
+        )
+        return chunk_texts_async(response)
+
+
+def _open_model_backend():
+    kind = os.getenv('MODEL_BACKEND', 'gemini')
+    if kind == 'fake':
+        from fake_backend import FakeBackend
+
+        return FakeBackend.from_env()
+    if kind == 'gemini':
+        api_key = os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        return GeminiBackend(api_key, model_name=os.getenv('GEMINI_MODEL', MODEL_NAME))
+    raise ValueError(f"Unknown MODEL_BACKEND: {kind}")
+
+
+def open_backend():
+    # HEDGE_PERCENTILE=95 re-sends requests slower to start than the p95
+    backend = _open_model_backend()
+    if os.getenv('HEDGE_PERCENTILE'):
+        from hedging import HedgedBackend
+
+        return HedgedBackend.from_env(backend)
+    return backend
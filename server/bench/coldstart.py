@@ -0,0 +1,117 @@
+"""Cold-start cost of the Vercel handlers.
+
+Starts a fresh interpreter the way a new function instance would and
+reports the import time of ``api/<handler>.py`` (the heaviest modules, from
+``python -X importtime``), then serves that handler in a second fresh
+interpreter and times its first request against later, warm ones:
+
+    python bench/coldstart.py --handler generate_website --max-import-ms 150
+
+The model is the fake backend with no simulated latency, so the numbers are
+the serving layer's own. ``--max-import-ms`` exits non-zero when the import
+goes over budget, for use as a regression check.
+
+Only the standard library is used so it runs anywhere the server does.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'api')
+
+BENCH_ENV = {
+    'VERCEL': '1',
+    'MODEL_BACKEND': 'fake',
+    'FAKE_TTFT': '0',
+    'FAKE_TOKENS_PER_SECOND': '1e9',
+}
+
+# Runs in the child: import the handler, serve it, time a few requests
+SERVE_SCRIPT = r"""
+import http.client, json, sys, threading, time
+from http.server import HTTPServer
+
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+handler = __import__(sys.argv[2]).handler
+imported = time.perf_counter() - started
+
+server = HTTPServer(('127.0.0.1', 0), handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+def request(index):
+    # A different prompt each time so the response cache never answers
+    body = json.dumps({'description': f'coldstart probe {index}'})
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+    conn.request('POST', '/', body, {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    if response.status != 200:
+        raise SystemExit(f'status {response.status}')
+    return time.perf_counter() - started
+
+latencies = [request(index) for index in range(int(sys.argv[3]) + 1)]
+print(json.dumps({'import': imported, 'first': latencies[0], 'warm': latencies[1:]}))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env.update(BENCH_ENV)
+    return env
+
+
+def import_profile(handler):
+    # [(cumulative seconds, module)] for the handler and everything it pulls in
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import sys; sys.path.insert(0, {API_DIR!r}); import {handler}"],
+        env=child_env(), capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((int(cumulative) / 1e6, name.rstrip()))
+    return modules
+
+
+def serve_profile(handler, warm_requests):
+    result = subprocess.run(
+        [sys.executable, '-c', SERVE_SCRIPT, API_DIR, handler, str(warm_requests)],
+        env=child_env(), capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--handler', default='generate_website')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--warm-requests', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    modules = import_profile(args.handler)
+    handler_seconds = next(seconds for seconds, name in modules if name.strip() == args.handler)
+    print(f"import {args.handler}: {handler_seconds * 1000:.1f} ms")
+    for seconds, name in sorted(modules, reverse=True)[:args.top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    timings = serve_profile(args.handler, args.warm_requests)
+    warm = sorted(timings['warm'])
+    print(f"first request: {timings['first'] * 1000:.1f} ms")
+    if warm:
+        print(f"warm requests: p50 {warm[len(warm) // 2] * 1000:.1f} ms, max {warm[-1] * 1000:.1f} ms")
+
+    if args.max_import_ms is not None and handler_seconds * 1000 > args.max_import_ms:
+        print(f"import time over budget ({args.max_import_ms:.0f} ms)")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
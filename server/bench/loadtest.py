@@ -0,0 +1,134 @@
+"""Concurrent SSE stream load test for the generation endpoints.
+
+Opens ``--streams`` simultaneous POSTs against one server process and holds
+them until each stream finishes, then reports how many completed, how many
+were shed (503/429) and the time-to-first-event / total-duration spread.
+Run it at increasing levels to find where a process stops keeping up:
+
+    python bench/loadtest.py --url http://localhost:3001 --levels 50,100,200,400
+
+Start the server with MODEL_BACKEND=fake (see fake_backend.FakeBackend and its
+FAKE_* settings) to measure the serving layer without Gemini quota.
+Raise MAX_CONCURRENT_STREAMS and the scheduler limits past the levels being
+tried, and set RESPONSE_CACHE_ENTRIES=0 so repeated levels aren't served from
+the cache; async_app.py records the results its default limit comes from.
+
+Only the standard library is used so it runs anywhere the server does.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def open_stream(url, path, body):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    payload = json.dumps(body).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\n"
+        f"Host: {parts.netloc}\r\n"
+        "Content-Type: application/json\r\n"
+        "Accept: text/event-stream\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        "Connection: close\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+    return reader, writer
+
+
+async def read_body(reader, chunked):
+    # Yield raw body pieces, undoing chunked transfer encoding if present
+    if not chunked:
+        while True:
+            piece = await reader.read(65536)
+            if not piece:
+                return
+            yield piece
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            return
+        yield await reader.readexactly(size)
+        await reader.readline()
+
+
+async def run_stream(url, path, body):
+    started = time.perf_counter()
+    result = {'status': None, 'first_event': None, 'duration': None, 'bytes': 0, 'done': False}
+    try:
+        reader, writer = await open_stream(url, path, body)
+        status_line = await reader.readline()
+        result['status'] = int(status_line.split()[1])
+        chunked = False
+        while True:
+            header = await reader.readline()
+            if header in (b'\r\n', b''):
+                break
+            if header.lower().startswith(b'transfer-encoding:') and b'chunked' in header.lower():
+                chunked = True
+
+        pending = b''
+        async for piece in read_body(reader, chunked):
+            result['bytes'] += len(piece)
+            lines = (pending + piece).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                if not line.startswith(b'data: '):
+                    continue
+                if result['first_event'] is None:
+                    result['first_event'] = time.perf_counter() - started
+                if json.loads(line[6:]).get('type') == 'done':
+                    result['done'] = True
+        writer.close()
+    except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+        result['error'] = str(e)
+    result['duration'] = time.perf_counter() - started
+    return result
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(level, results, wall):
+    done = [r for r in results if r['done']]
+    shed = [r for r in results if r['status'] in (429, 503)]
+    failed = len(results) - len(done) - len(shed)
+    first = [r['first_event'] for r in done]
+    total = [r['duration'] for r in done]
+    print(
+        f"streams={level:5d} completed={len(done):5d} shed={len(shed):5d} failed={failed:5d} "
+        f"ttfe p50={percentile(first, 0.5):6.2f}s p95={percentile(first, 0.95):6.2f}s "
+        f"duration p50={percentile(total, 0.5):6.2f}s max={max(total, default=float('nan')):6.2f}s "
+        f"wall={wall:6.2f}s"
+    )
+    if done:
+        print(f"{'':14}mean bytes/stream={statistics.mean(r['bytes'] for r in done):.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:3001')
+    parser.add_argument('--path', default='/api/generate-website')
+    parser.add_argument('--levels', default='10,50,100,200')
+    parser.add_argument('--description', default='portfolio website for a photographer')
+    args = parser.parse_args()
+
+    for level in (int(n) for n in args.levels.split(',')):
+        started = time.perf_counter()
+        # Vary the description so every stream is a distinct generation
+        results = await asyncio.gather(*(
+            run_stream(args.url, args.path, {'description': f"{args.description} #{i}"})
+            for i in range(level)
+        ))
+        report(level, results, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
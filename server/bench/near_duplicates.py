@@ -0,0 +1,127 @@
+"""Near-duplicate description index lookup latency and hit rate.
+
+Fills a SimilarPrompts index with ``--entries`` synthetic descriptions, then
+looks up paraphrases of stored ones (content words dropped, substituted and
+added, then reordered) and unrelated descriptions. Paraphrases are grouped
+by their exact Jaccard similarity to the description they came from, so the
+hit rate of the buckets at or above the threshold is the recall; below it,
+hits are matches to some other stored description. Lookup latency is
+reported for each group:
+
+    python bench/near_duplicates.py --entries 100000 --threshold 0.8
+
+Only the standard library is used so it runs anywhere the server does.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similar_prompts import SimilarPrompts, description_tokens  # noqa: E402
+
+KINDS = ['landing page', 'portfolio', 'blog', 'online store', 'restaurant menu', 'agency homepage',
+         'event page', 'documentation hub', 'photo gallery', 'pricing page', 'resume', 'dashboard']
+SUBJECTS = ['coffee shop', 'photographer', 'yoga studio', 'law firm', 'bakery', 'startup', 'dentist',
+            'architect', 'florist', 'music festival', 'bookstore', 'gym', 'travel agency', 'wine bar',
+            'tattoo parlor', 'vet clinic', 'podcast', 'nonprofit', 'hotel', 'car rental']
+STYLES = ['modern', 'minimal', 'dark', 'playful', 'elegant', 'retro', 'colorful', 'corporate',
+          'bold', 'pastel', 'brutalist', 'glassmorphism', 'neon', 'earthy', 'luxury', 'clean']
+FEATURES = ['contact form', 'testimonials', 'image carousel', 'newsletter signup', 'faq section',
+            'team grid', 'booking widget', 'map', 'video hero', 'pricing table', 'blog feed',
+            'instagram feed', 'countdown timer', 'dark mode toggle', 'animated stats', 'sticky header']
+
+
+def description(rng):
+    words = [rng.choice(STYLES), rng.choice(KINDS), 'for a', rng.choice(SUBJECTS), 'with']
+    words.append(' and '.join(rng.sample(FEATURES, rng.randint(1, 3))))
+    if rng.random() < 0.5:
+        words.insert(0, rng.choice(STYLES))
+    return ' '.join(words)
+
+
+VOCABULARY = sorted({word for phrase in KINDS + SUBJECTS + STYLES + FEATURES for word in phrase.split()})
+# (kept, dropped, substituted) weights for each content word
+EDITS = (0.85, 0.08, 0.07)
+
+
+def paraphrase(rng, text):
+    # Only edits to content words change the word set the index compares
+    words = []
+    for word in text.split():
+        if word not in description_tokens(word):
+            words.append(word)
+            continue
+        edit = rng.choices(('keep', 'drop', 'substitute'), EDITS)[0]
+        if edit == 'keep':
+            words.append(word)
+        elif edit == 'substitute':
+            words.append(rng.choice(VOCABULARY))
+    if rng.random() < 0.3:
+        words.append(rng.choice(VOCABULARY))
+    rng.shuffle(words)
+    return ' '.join(words)
+
+
+def jaccard(a, b):
+    a, b = set(description_tokens(a)), set(description_tokens(b))
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def bucket(similarity):
+    # Tenths, highest first; identical word sets get their own
+    return 10 if similarity >= 1.0 else int(similarity * 10)
+
+
+def bucket_label(tenths):
+    return 'J = 1.0' if tenths == 10 else f"J {tenths / 10:.1f}-{(tenths + 1) / 10:.1f}"
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = SimilarPrompts(threshold=args.threshold, max_entries=args.entries)
+    stored = [description(rng) for _ in range(args.entries)]
+
+    started = time.perf_counter()
+    for number, text in enumerate(stored):
+        index.add(text, f"{number:032x}", '0' * 16)
+    elapsed = time.perf_counter() - started
+    print(f"indexed {len(index)} descriptions in {elapsed:.1f}s "
+          f"({elapsed / args.entries * 1e6:.0f} us each, {index.bands} bands x {index.rows} rows)")
+
+    buckets = {}
+    for _ in range(args.lookups):
+        source = rng.choice(stored)
+        query = paraphrase(rng, source)
+        buckets.setdefault(bucket(jaccard(source, query)), []).append(query)
+    groups = {bucket_label(tenths): buckets[tenths] for tenths in sorted(buckets, reverse=True)}
+    groups['unrelated'] = [f"{rng.choice(SUBJECTS)} {rng.choice(['wiki', 'forum', 'webshop'])} in {rng.choice(STYLES)} tones"
+                           for _ in range(args.lookups)]
+
+    for label, queries in groups.items():
+        latencies, hits = [], 0
+        for query in queries:
+            started = time.perf_counter()
+            hits += index.lookup(query) is not None
+            latencies.append(time.perf_counter() - started)
+        print(f"{label}: {len(queries)} lookups, hit rate {hits / len(queries):.1%}, "
+              f"lookup p50 {statistics.median(latencies) * 1e6:.0f} us, "
+              f"p99 {percentile(latencies, 0.99) * 1e6:.0f} us, max {max(latencies) * 1e6:.0f} us")
+
+
+if __name__ == '__main__':
+    main()
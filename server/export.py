@@ -0,0 +1,625 @@
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from generation import InvalidRequest
+from metrics import export_build_seconds, exports_total
+from sectioned import CSS_ATTRIBUTE, HTML_CLASS, HTML_ID, SELECTOR_NAME
+
+STRING = r'''"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*\''''
+CSS_STRING_OR_COMMENT = re.compile(rf'({STRING})|/\*.*?\*/', re.S)
+CSS_STRING = re.compile(rf'({STRING})', re.S)
+CSS_STRUCTURE = re.compile(rf'{STRING}|[{{}};]', re.S)
+CSS_SPACE = re.compile(r'\s+')
+CSS_PUNCTUATION = re.compile(r' ?([{};,>]) ?')
+CSS_COLON = re.compile(r': ')
+CSS_LAST_SEMICOLON = re.compile(r';+}')
+# At-rules whose block holds more rules rather than declarations
+CSS_GROUPING_RULES = frozenset(['@media', '@supports', '@layer', '@container', '@document'])
+# :not(.a), :is(.a, .b) and friends match without every name they mention
+CSS_FUNCTIONAL_PSEUDO = re.compile(r':[\w-]+\(')
+HTML_BARE_NAME = re.compile(r'''\b(?:id|class)\s*=\s*([^\s"'>]+)''')
+JS_WORD = re.compile(r'-?[_a-zA-Z][\w-]*')
+
+JS_BLANKS = re.compile(r'[ \t\r\f\v]+')
+JS_NEWLINES = re.compile(r' ?\n[\s]*')
+# Spaces around these never matter; + - / and . are left alone (a + +b, 1 .toFixed)
+JS_TIGHT = re.compile(r' ?([{}()\[\];,=:?&|<>!*%^~]) ?')
+# Line breaks after these, or before a '}', can't change where statements end
+JS_LINE_JOIN = re.compile(r'([{;,])\n|\n(?=})')
+JS_REGEX_PRECEDERS = frozenset('(,=:[!&|?{};+-*%<>~^')
+JS_REGEX_KEYWORDS = frozenset(['return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete',
+                               'void', 'throw', 'yield', 'await', 'instanceof'])
+JS_TRAILING_WORD = re.compile(r'[\w$]+$')
+# A ')' closing one of these conditions is followed by a statement, which may be a regex
+JS_CONTROL_KEYWORDS = frozenset(['if', 'while', 'for', 'with'])
+
+HTML_RAW_TEXT = re.compile(r'(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)', re.S | re.I)
+HTML_TAG = re.compile(r'(<[^>]*>)')
+HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+HTML_TYPE = re.compile(r'''\btype\s*=\s*["']?([^"'\s>]+)''', re.I)
+HTML_HEAD_END = re.compile(r'</head\s*>', re.I)
+HTML_BODY_START = re.compile(r'<body\b[^>]*>', re.I)
+HTML_BODY_END = re.compile(r'</body\s*>', re.I)
+HTML_DOCUMENT = re.compile(r'<html\b[^>]*>', re.I)
+HTML_STYLESHEET_LINK = re.compile(r'''<link\b[^>]*\bhref\s*=\s*["']?(?:\./)?styles\.css["']?[^>]*>''', re.I)
+HTML_SCRIPT_SRC = re.compile(r'''<script\b[^>]*\bsrc\s*=\s*["']?(?:\./)?script\.js["']?[^>]*>\s*</script\s*>''', re.I)
+CLOSING_RAW_TAG = re.compile(r'</(script|style)', re.I)
+
+DOCUMENT = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>Website</title>
+</head>
+<body>
+{body}
+</body>
+</html>
+'''
+
+ZIP_FILE_HEADER = struct.Struct('<IHHHHHIIIHH')
+ZIP_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+ZIP_END = struct.Struct('<IHHHHIIH')
+# UTF-8 names; a fixed 1980-01-01 timestamp keeps exports byte-for-byte repeatable
+ZIP_FLAGS = 0x0800
+ZIP_DOS_TIME, ZIP_DOS_DATE = 0, (1 << 5) | 1
+ZIP_CHUNK_BYTES = 64 * 1024
+
+
+def _without_css_comments(css):
+    # A comment still separates what's either side of it; strings may hold '/*'
+    return CSS_STRING_OR_COMMENT.sub(lambda match: match.group(1) or ' ', css)
+
+
+def minify_css(css):
+    """CSS without comments and without whitespace that doesn't separate anything.
+
+    Strings are left exactly as written.
+    """
+    pieces = CSS_STRING.split(_without_css_comments(css))
+    for index in range(0, len(pieces), 2):
+        code = CSS_SPACE.sub(' ', pieces[index])
+        code = CSS_COLON.sub(':', CSS_PUNCTUATION.sub(r'\1', code))
+        pieces[index] = CSS_LAST_SEMICOLON.sub('}', code)
+    return ''.join(pieces).strip()
+
+
+def _string_end(js, i, quote):
+    i += 1
+    while i < len(js):
+        c = js[i]
+        if c == '\\':
+            i += 2
+        elif c == quote:
+            return i + 1
+        elif c == '\n':
+            # Unterminated; don't let it swallow the rest of the file
+            return i
+        else:
+            i += 1
+    return len(js)
+
+
+def _template_end(js, i):
+    # (end, True) when the template text stops at a '${', (end, False) at the closing backtick
+    while i < len(js):
+        c = js[i]
+        if c == '\\':
+            i += 2
+        elif c == '`':
+            return i + 1, False
+        elif c == '$' and js.startswith('{', i + 1):
+            return i + 2, True
+        else:
+            i += 1
+    return len(js), False
+
+
+def _regex_end(js, i):
+    i += 1
+    in_class = False
+    while i < len(js):
+        c = js[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '\n':
+            return i
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            return i + 1
+        i += 1
+    return len(js)
+
+
+def _regex_allowed(pieces, code, after_condition):
+    # A slash starts a regex after an operator, an opening bracket or a
+    # keyword like return; after a name, a number, a literal or a closing
+    # bracket it divides, except after the ')' of an if (x) and the like
+    text = code.rstrip()
+    if not text:
+        for literal, piece in reversed(pieces):
+            if piece.strip():
+                if literal:
+                    return False
+                text = piece.rstrip()
+                break
+    if not text:
+        return True
+    if text[-1] in JS_REGEX_PRECEDERS:
+        return True
+    if text[-1] == ')':
+        return after_condition
+    word = JS_TRAILING_WORD.search(text)
+    return word is not None and word.group() in JS_REGEX_KEYWORDS
+
+
+def _js_pieces(js):
+    # [(literal, text)] with comments taken out. Strings, regexes and the
+    # text parts of template literals are literals and must not be touched.
+    pieces = []
+    templates = []  # brace depth inside each open ${...}
+    parens = []  # whether each open '(' follows if/while/for/with
+    after_condition = False  # ...and whether the last ')' closed one
+    start = i = 0
+    while i < len(js):
+        c = js[i]
+        if c in '"\'':
+            end = _string_end(js, i, c)
+        elif c == '`' or (c == '}' and templates and templates[-1] == 0):
+            if c == '}':
+                templates.pop()
+            end, substitution = _template_end(js, i + 1)
+            if substitution:
+                templates.append(0)
+        elif js.startswith('//', i):
+            end = js.find('\n', i)
+            end = len(js) if end < 0 else end
+            pieces.append((False, js[start:i]))
+            i = start = end
+            continue
+        elif js.startswith('/*', i):
+            end = js.find('*/', i + 2)
+            end = len(js) if end < 0 else end + 2
+            # A comment spanning lines still ends a statement
+            pieces.append((False, js[start:i] + ('\n' if '\n' in js[i:end] else ' ')))
+            i = start = end
+            continue
+        elif c == '/' and _regex_allowed(pieces, js[start:i], after_condition):
+            end = _regex_end(js, i)
+        else:
+            if c == '(':
+                word = JS_TRAILING_WORD.search(js[start:i].rstrip())
+                parens.append(word is not None and word.group() in JS_CONTROL_KEYWORDS)
+            elif c == ')':
+                after_condition = parens.pop() if parens else False
+            if templates and c == '{':
+                templates[-1] += 1
+            elif templates and c == '}':
+                templates[-1] -= 1
+            i += 1
+            continue
+        pieces.append((False, js[start:i]))
+        pieces.append((True, js[i:end]))
+        i = start = end
+    pieces.append((False, js[start:]))
+    return pieces
+
+
+def minify_js(js):
+    """JavaScript without comments, indentation and blank lines.
+
+    This is a whitespace minifier, not a compressor: names are kept and a
+    line break is only dropped where it can't end a statement, so automatic
+    semicolon insertion works out the same as in the original.
+    """
+    pieces = []
+    code = []
+    for literal, text in _js_pieces(js) + [(True, '')]:
+        if not literal:
+            # Code either side of a comment is squeezed as one piece
+            code.append(text)
+            continue
+        squeezed = JS_NEWLINES.sub('\n', JS_BLANKS.sub(' ', ''.join(code)))
+        pieces.append(JS_LINE_JOIN.sub(r'\1', JS_TIGHT.sub(r'\1', squeezed)))
+        pieces.append(text)
+        code = []
+    return ''.join(pieces).strip()
+
+
+def _minify_raw_text(match):
+    tag, name, content, end = match.groups()
+    name = name.lower()
+    if name == 'style':
+        content = minify_css(content)
+    elif name == 'script':
+        kind = HTML_TYPE.search(tag)
+        if kind is None or 'javascript' in kind.group(1).lower() or kind.group(1).lower() == 'module':
+            content = minify_js(content)
+    return tag + content + end
+
+
+def minify_html(html):
+    """HTML without comments and with runs of whitespace between and inside
+    text collapsed to one space.
+
+    Inline ``<style>`` and ``<script>`` go through the CSS and JavaScript
+    minifiers; ``<pre>`` and ``<textarea>`` are kept as written, as are the
+    tags themselves.
+    """
+    pieces = []
+    position = 0
+    for match in HTML_RAW_TEXT.finditer(html):
+        pieces.append(_minify_markup(html[position:match.start()]))
+        pieces.append(_minify_raw_text(match))
+        position = match.end()
+    pieces.append(_minify_markup(html[position:]))
+    return ''.join(pieces).strip()
+
+
+def _minify_markup(html):
+    parts = HTML_TAG.split(HTML_COMMENT.sub('', html))
+    for index in range(0, len(parts), 2):
+        parts[index] = CSS_SPACE.sub(' ', parts[index])
+    return ''.join(parts)
+
+
+def _block_end(css, position):
+    # Index of the '}' closing the block that starts at position
+    depth = 0
+    for match in CSS_STRUCTURE.finditer(css, position):
+        token = match.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            if not depth:
+                return match.start()
+            depth -= 1
+    return len(css)
+
+
+def _parse_css(css, position=0):
+    # ([(prelude, body)], end) for the rules from position to the end of the
+    # enclosing block. body is the declaration text of a style rule (or of an
+    # at-rule like @font-face or @keyframes), a nested list for @media and
+    # the other grouping rules, and None for statements like @import.
+    rules = []
+    start = position
+    while True:
+        match = CSS_STRUCTURE.search(css, position)
+        if match is None or match.group() == '}':
+            rest = css[start:match.start() if match else len(css)].strip()
+            if rest:
+                rules.append((rest, None))
+            return rules, match.end() if match else len(css)
+        token = match.group()
+        position = match.end()
+        if token == ';':
+            if css[start:match.start()].strip():
+                rules.append((css[start:match.start()].strip(), None))
+            start = position
+        elif token == '{':
+            prelude = css[start:match.start()].strip()
+            if prelude.split(' ', 1)[0].lower() in CSS_GROUPING_RULES:
+                body, position = _parse_css(css, position)
+            else:
+                end = _block_end(css, position)
+                body, position = css[position:end], end + 1
+            rules.append((prelude, body))
+            start = position
+
+
+def _split_selectors(prelude):
+    # Top-level commas only; :is(a, b) is one selector
+    selectors, depth, start = [], 0, 0
+    for index, c in enumerate(prelude):
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif c == ',' and not depth:
+            selectors.append(prelude[start:index])
+            start = index + 1
+    selectors.append(prelude[start:])
+    return selectors
+
+
+def _without_functional_pseudos(selector):
+    result, position = [], 0
+    for match in CSS_FUNCTIONAL_PSEUDO.finditer(selector):
+        if match.start() < position:
+            continue
+        result.append(selector[position:match.end()])
+        depth, index = 1, match.end()
+        while index < len(selector) and depth:
+            depth += {'(': 1, ')': -1}.get(selector[index], 0)
+            index += 1
+        result.append(')')
+        position = index
+    result.append(selector[position:])
+    return ''.join(result)
+
+
+def _defined(name, names):
+    # Scripts often number names ('item' + i) or template them (`item-${i}`),
+    # so a defined prefix ending in '-' or '_', or a digit suffix, counts too
+    if name in names or name.rstrip('0123456789') in names:
+        return True
+    return any(name[:index + 1] in names for index, c in enumerate(name) if c in '-_')
+
+
+def _selector_matches(selector, ids, classes):
+    # False only when the selector needs an id or class that nothing defines
+    if '\\' in selector:
+        return True
+    for kind, name in SELECTOR_NAME.findall(CSS_ATTRIBUTE.sub('', _without_functional_pseudos(selector))):
+        if not _defined(name, ids if kind == '#' else classes):
+            return False
+    return True
+
+
+def _prune_rules(rules, ids, classes):
+    kept = []
+    for prelude, body in rules:
+        if isinstance(body, list):
+            body = _prune_rules(body, ids, classes)
+            if not body:
+                continue
+        elif body is not None and not prelude.startswith('@'):
+            selectors = [selector.strip() for selector in _split_selectors(prelude)
+                         if _selector_matches(selector, ids, classes)]
+            if not selectors:
+                continue
+            prelude = ', '.join(selectors)
+        kept.append((prelude, body))
+    return kept
+
+
+def _render_css(rules, indent=''):
+    blocks = []
+    for prelude, body in rules:
+        if body is None:
+            blocks.append(f"{indent}{prelude};")
+        elif isinstance(body, list):
+            blocks.append(f"{indent}{prelude} {{\n{_render_css(body, indent + '  ')}\n{indent}}}")
+        else:
+            blocks.append(f"{indent}{prelude} {{{body}}}")
+    return '\n\n'.join(blocks)
+
+
+def defined_names(html, js):
+    """``(ids, classes)`` the page's markup could give an element.
+
+    The HTML's id and class attributes, plus every name-like word in the
+    JavaScript, since scripts build class names and markup in ways no
+    pattern can follow. Pruning against these only drops rules that
+    certainly match nothing.
+    """
+    ids = set(HTML_ID.findall(html))
+    classes = {name for names in HTML_CLASS.findall(html) for name in names.split()}
+    bare = set(HTML_BARE_NAME.findall(html))
+    words = set(JS_WORD.findall(js))
+    return ids | bare | words, classes | bare | words
+
+
+def prune_css(css, html, js=''):
+    """``css`` without the style rules no element of the page can match.
+
+    A selector list loses the selectors that need an id or class missing
+    from ``defined_names``; a rule with none left is dropped, as is an
+    ``@media`` (or other grouping rule) left empty. Other at-rules are kept
+    as they are.
+    """
+    ids, classes = defined_names(html, js)
+    rules, _ = _parse_css(_without_css_comments(css))
+    return _render_css(_prune_rules(rules, ids, classes))
+
+
+def _raw_text_safe(text):
+    # Keeps a '</script' or '</style' inside the code from closing the element
+    return CLOSING_RAW_TAG.sub(lambda match: '<\\/' + match.group(1), text)
+
+
+def _with_assets(html, head, tail):
+    # html with head inserted before </head> and tail before </body>; a
+    # fragment (as the generator often writes) becomes a full document
+    if not HTML_DOCUMENT.search(html):
+        html = DOCUMENT.format(body=html.strip())
+    if head:
+        end = HTML_HEAD_END.search(html)
+        body = HTML_BODY_START.search(html)
+        at = end.start() if end else body.start() if body else HTML_DOCUMENT.search(html).end()
+        html = f"{html[:at]}{head}\n{html[at:]}"
+    if tail:
+        ends = list(HTML_BODY_END.finditer(html))
+        at = ends[-1].start() if ends else len(html)
+        html = f"{html[:at]}{tail}\n{html[at:]}"
+    return html
+
+
+def linked_site(html, css, js):
+    # index.html loading styles.css and script.js, unless it already does
+    head = '<link rel="stylesheet" href="styles.css">' if css and not HTML_STYLESHEET_LINK.search(html) else ''
+    tail = '<script src="script.js"></script>' if js and not HTML_SCRIPT_SRC.search(html) else ''
+    return _with_assets(html, head, tail)
+
+
+def inline_site(html, css, js):
+    # One index.html with the CSS and JavaScript in <style> and <script>
+    html = HTML_SCRIPT_SRC.sub('', HTML_STYLESHEET_LINK.sub('', html))
+    head = f"<style>\n{_raw_text_safe(css)}\n</style>" if css else ''
+    tail = f"<script>\n{_raw_text_safe(js)}\n</script>" if js else ''
+    return _with_assets(html, head, tail)
+
+
+class ExportOptions:
+    """What the export does to a project's sections.
+
+    ``prune`` drops the CSS rules nothing in the HTML or JavaScript can
+    match, ``minify`` strips comments and whitespace from all three and
+    ``inline`` puts the CSS and JavaScript into index.html instead of
+    styles.css and script.js.
+    """
+
+    FLAGS = ('minify', 'prune', 'inline')
+
+    def __init__(self, minify=True, prune=True, inline=False):
+        self.minify = minify
+        self.prune = prune
+        self.inline = inline
+
+    @classmethod
+    def from_query(cls, args):
+        values = {}
+        for flag in cls.FLAGS:
+            value = args.get(flag)
+            if value is None:
+                continue
+            if value.lower() not in ('1', 'true', 'yes', '0', 'false', 'no'):
+                raise InvalidRequest(f"{flag} must be 1 or 0")
+            values[flag] = value.lower() in ('1', 'true', 'yes')
+        return cls(**values)
+
+    @property
+    def tag(self):
+        # Short, stable name for these options in cache keys and ETags
+        return ''.join(flag[0] for flag in self.FLAGS if getattr(self, flag)) or 'raw'
+
+
+def export_files(sections, options):
+    """``(name, bytes)`` for each file of the export, built one at a time."""
+    html, css, js = sections.get('html') or '', sections.get('css') or '', sections.get('js') or ''
+    if options.prune and css:
+        css = prune_css(css, html, js)
+    if options.minify:
+        css, js = minify_css(css), minify_js(js)
+    if options.inline:
+        html = inline_site(html, css, js)
+    else:
+        html = linked_site(html, css, js)
+    yield 'index.html', (minify_html(html) if options.minify else html).encode()
+    if not options.inline:
+        if css:
+            yield 'styles.css', css.encode()
+        if js:
+            yield 'script.js', js.encode()
+
+
+def zip_stored(files):
+    """Yields a ZIP archive of ``(name, bytes)`` files as it is written.
+
+    Entries are stored uncompressed, and each file is complete before its
+    entry is written, so sizes and CRCs go straight into the local headers:
+    nothing needs seeking back to and no temporary file is involved.
+    """
+    directory = []
+    offset = 0
+    for name, data in files:
+        encoded = name.encode()
+        crc = zlib.crc32(data)
+        header = ZIP_FILE_HEADER.pack(
+            0x04034b50, 20, ZIP_FLAGS, 0, ZIP_DOS_TIME, ZIP_DOS_DATE, crc, len(data), len(data), len(encoded), 0)
+        yield header + encoded
+        for start in range(0, len(data), ZIP_CHUNK_BYTES):
+            yield data[start:start + ZIP_CHUNK_BYTES]
+        directory.append(ZIP_CENTRAL_HEADER.pack(
+            0x02014b50, (3 << 8) | 20, 20, ZIP_FLAGS, 0, ZIP_DOS_TIME, ZIP_DOS_DATE, crc, len(data), len(data),
+            len(encoded), 0, 0, 0, 0, 0o100644 << 16, offset) + encoded)
+        offset += len(header) + len(encoded) + len(data)
+
+    central = b''.join(directory)
+    yield central
+    yield ZIP_END.pack(0x06054b50, 0, 0, len(directory), len(directory), len(central), offset, 0)
+
+
+def export_key(project_id, revision, options):
+    # Revisions are content hashes, so this names the exact bytes exported
+    return f"{project_id}/{revision}/{options.tag}"
+
+
+def export_etag(revision, options):
+    return f'"{revision}-{options.tag}"'
+
+
+class ExportCache:
+    """Finished ZIP exports, least recently used first out.
+
+    A revision's export never changes, so entries don't expire; they are
+    only evicted to stay within ``max_entries`` and ``max_bytes``. Exports
+    are streamed while they are built and only cached once complete.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv('EXPORT_CACHE_ENTRIES', '64')),
+            max_bytes=int(os.getenv('EXPORT_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+        )
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if self.max_entries <= 0 or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += len(data)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _build(self, key, sections, options):
+        started = time.perf_counter()
+        chunks = []
+        for chunk in zip_stored(export_files(sections, options)):
+            chunks.append(chunk)
+            yield chunk
+        export_build_seconds.observe(time.perf_counter() - started)
+        self.put(key, b''.join(chunks))
+
+    def open(self, key, load_sections, options):
+        """``(chunks, size)`` of the export's ZIP, from the cache or built as
+        it streams.
+
+        ``load_sections()`` is only called on a miss, and before anything is
+        streamed, so an unknown project still gets an ordinary error
+        response. ``size`` is None when the export is being built.
+        """
+        data = self.get(key)
+        if data is not None:
+            exports_total.inc('hit')
+            return (data[start:start + ZIP_CHUNK_BYTES] for start in range(0, len(data), ZIP_CHUNK_BYTES)), len(data)
+        sections = load_sections()
+        exports_total.inc('miss')
+        return self._build(key, sections, options), None
+
+
+async def chunks_async(chunks):
+    import asyncio
+
+    # Building is CPU work in small steps; let other requests run between chunks
+    for chunk in chunks:
+        yield chunk
+        await asyncio.sleep(0)
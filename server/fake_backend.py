@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from backends import ModelBackend
+from generation import GENERATION_SETTINGS
+
+SAMPLE_RESPONSE = """```html
+<header class="hero">
+  <h1 class="hero-title">Studio Lumen</h1>
+  <p class="hero-subtitle">Portraits, weddings and editorial photography</p>
+  <a href="#gallery" class="cta-button">View gallery</a>
+</header>
+<section id="gallery" class="gallery">
+  <img src="https://picsum.photos/seed/1/600/400" alt="Sample work">
+  <img src="https://picsum.photos/seed/2/600/400" alt="Sample work">
+  <img src="https://picsum.photos/seed/3/600/400" alt="Sample work">
+</section>
+<footer class="footer">&copy; Studio Lumen</footer>
+```
+```css
+body {
+  margin: 0;
+  font-family: 'Inter', sans-serif;
+  background: linear-gradient(120deg, #1e3c72, #2a5298, #6dd5ed);
+  background-size: 400% 400%;
+  animation: gradient 15s ease infinite;
+}
+@keyframes gradient {
+  0% { background-position: 0% 50%; }
+  50% { background-position: 100% 50%; }
+  100% { background-position: 0% 50%; }
+}
+.hero { padding: 6rem 2rem; text-align: center; color: #fff; }
+.cta-button { padding: 0.8rem 1.6rem; border-radius: 999px; background: #fff; color: #1e3c72; }
+.gallery { display: grid; grid-template-columns: repeat(auto-fit, minmax(240px, 1fr)); gap: 1rem; padding: 2rem; }
+.gallery img { width: 100%; border-radius: 12px; transition: transform 0.3s; }
+.gallery img:hover { transform: scale(1.03); }
+.footer { text-align: center; padding: 2rem; color: #fff; }
+```
+```javascript
+document.querySelectorAll('.gallery img').forEach((img) => {
+  img.addEventListener('click', () => img.classList.toggle('expanded'));
+});
+```
+"""
+
+
+class FakeBackendError(RuntimeError):
+    pass
+
+
+class FakeBackend(ModelBackend):
+    """Deterministic local stand-in for Gemini, for load tests and CI.
+
+    Replays a recorded response (chosen by prompt hash) at a configurable
+    time-to-first-token and tokens/sec, re-chunked into ``chunk_tokens``
+    pieces (a token is taken as 4 characters). ``recordings`` is a directory
+    of ``.txt`` files or ``.json`` files with a ``chunks`` list, which is
+    what ``ResponseCache`` writes to RESPONSE_CACHE_DIR, so real traffic can
+    be captured and replayed. ``error_rate`` fails requests when the stream
+    is opened and ``stream_error_rate`` fails them halfway through; both are
+    seeded by the prompt, so a given prompt always behaves the same way.
+    """
+
+    model_name = 'fake'
+
+    def __init__(self, recordings=None, ttft=0.5, tokens_per_second=200.0, chunk_tokens=20,
+                 error_rate=0.0, stream_error_rate=0.0, seed=0, settings=GENERATION_SETTINGS):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.stream_error_rate = stream_error_rate
+        self.seed = seed
+        self.settings = settings
+        self.responses = self._load(recordings) if recordings else [SAMPLE_RESPONSE]
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            recordings=os.getenv('FAKE_RECORDINGS') or None,
+            ttft=float(os.getenv('FAKE_TTFT', '0.5')),
+            tokens_per_second=float(os.getenv('FAKE_TOKENS_PER_SECOND', '200')),
+            chunk_tokens=int(os.getenv('FAKE_CHUNK_TOKENS', '20')),
+            error_rate=float(os.getenv('FAKE_ERROR_RATE', '0')),
+            stream_error_rate=float(os.getenv('FAKE_STREAM_ERROR_RATE', '0')),
+            seed=int(os.getenv('FAKE_SEED', '0')),
+        )
+
+    def _load(self, directory):
+        responses = []
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.endswith('.txt'):
+                with open(path) as f:
+                    responses.append(f.read())
+            elif name.endswith('.json'):
+                with open(path) as f:
+                    responses.append(''.join(json.load(f)['chunks']))
+        if not responses:
+            raise ValueError(f"No recorded responses found in {directory}")
+        return responses
+
+    def _plan(self, prompt):
+        # Everything about a fake response is a function of the prompt
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode()).digest()
+        rng = random.Random(digest)
+        text = self.responses[int.from_bytes(digest[:4], 'big') % len(self.responses)]
+        if rng.random() < self.error_rate:
+            raise FakeBackendError('Injected upstream error')
+
+        size = self.chunk_tokens * 4
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        fail_at = len(chunks) // 2 if rng.random() < self.stream_error_rate else None
+        return chunks, fail_at, self.chunk_tokens / self.tokens_per_second
+
+    def stream(self, prompt):
+        chunks, fail_at, interval = self._plan(prompt)
+
+        def texts():
+            time.sleep(self.ttft)
+            for index, chunk in enumerate(chunks):
+                if index == fail_at:
+                    raise FakeBackendError('Injected mid-stream error')
+                if index:
+                    time.sleep(interval)
+                yield chunk
+
+        return texts()
+
+    async def stream_async(self, prompt):
+        chunks, fail_at, interval = self._plan(prompt)
+
+        async def texts():
+            await asyncio.sleep(self.ttft)
+            for index, chunk in enumerate(chunks):
+                if index == fail_at:
+                    raise FakeBackendError('Injected mid-stream error')
+                if index:
+                    await asyncio.sleep(interval)
+                yield chunk
+
+        return texts()
@@ -0,0 +1,214 @@
+from section_parser import FENCE_LANGUAGES
+
+MODEL_NAME = 'gemini-2.5-flash-preview-04-17'
+
+# Sampling settings shared by every generation call
+GENERATION_SETTINGS = {
+    'temperature': 0.8,
+    'top_p': 0.9,
+    'top_k': 40,
+    'max_output_tokens': 8192,
+}
+
+
+class InvalidRequest(ValueError):
+    pass
+
+
+def generate_description(data):
+    if not data:
+        raise InvalidRequest('No JSON data received')
+
+    description = data.get('description')
+    if not description:
+        raise InvalidRequest('No description provided')
+
+    return description
+
+
+def build_generate_prompt(data):
+    description = generate_description(data)
+
+    return f"""
+        Create a visually appealing, professional website based on this description: {description}
+        
+        Important requirements:
+        1. Include a gradient animated background that smoothly transitions between colors
+        2. Use modern CSS features including animations, transitions, and flexbox/grid layouts
+        3. Make the design visually striking with proper spacing, typography, and color harmony
+        4. Include placeholder images with proper styling (use lorem picsum or unsplash source URLs)
+        5. Ensure the website is fully responsive and mobile-friendly
+        6. Add subtle animations for UI elements (buttons, links, sections) to enhance user experience
+        
+        Return only the HTML, CSS, and JavaScript code without any explanations.
+        Format the response exactly as:
+        ```html
+        [HTML code here]
+        ```
+        ```css
+        [CSS code here]
+        ```
+        ```javascript
+        [JavaScript code here]
+        ```
+        Make sure the code is complete, functional, and properly handles user interactions.
+        The JavaScript code should be properly scoped and not interfere with the parent window.
+        """
+
+
+def build_spec_prompt(data):
+    description = generate_description(data)
+
+    return f"""
+        Plan a visually appealing, professional website based on this description: {description}
+
+        Do not write the code. The HTML, CSS and JavaScript will be written separately, at the
+        same time, from your plan, so it must name everything they share.
+        Return only a compact JSON spec in a single json block, without any explanations:
+        ```json
+        {{
+          "title": "page title",
+          "palette": {{"background": ["#...", "#...", "#..."], "primary": "#...", "accent": "#...", "text": "#..."}},
+          "fonts": {{"heading": "...", "body": "..."}},
+          "sections": [{{"id": "section-id", "content": "what the section shows"}}],
+          "ids": {{"element-id": "what the element is"}},
+          "classes": {{"class-name": "what it styles"}},
+          "stateClasses": {{"class-name": "state the JavaScript toggles it for"}},
+          "interactions": ["what the JavaScript does, naming the ids and classes it uses"]
+        }}
+        ```
+        Name every id and class the page needs and keep each description to a few words.
+        """
+
+
+SECTION_BRIEFS = {
+    'html': """
+        1. Write the page markup, giving every section and element the id and classes from the spec
+        2. Use semantic elements and placeholder images (lorem picsum or unsplash source URLs)
+        3. Do not include style or script tags or link any stylesheets or scripts; the CSS and
+           JavaScript are added to the page separately
+        """,
+    'css': """
+        1. Include a gradient animated background that smoothly transitions between the palette colors
+        2. Use modern CSS features including animations, transitions, and flexbox/grid layouts
+        3. Make the design visually striking with proper spacing, typography, and color harmony
+        4. Ensure the website is fully responsive and mobile-friendly
+        5. Add subtle animations and hover/focus states for buttons, links and sections
+        6. Style the state classes from the spec too; the JavaScript toggles them
+        """,
+    'js': """
+        1. Implement the interactions from the spec, finding elements only by the spec's ids and classes
+        2. Use only the state classes from the spec to change how elements look
+        3. Check that elements exist before using them
+        4. The JavaScript code should be properly scoped and not interfere with the parent window
+        """,
+}
+
+SECTION_NAMES = {'html': 'HTML', 'css': 'CSS', 'js': 'JavaScript'}
+
+
+def build_section_prompt(data, spec, section):
+    description = generate_description(data)
+    name = SECTION_NAMES[section]
+
+    return f"""
+        Write only the {name} for a website based on this description: {description}
+
+        The HTML, CSS and JavaScript are being written separately, at the same time, from this
+        shared spec. Use its ids and class names exactly as spelled and don't invent others:
+        ```json
+        {spec}
+        ```
+
+        Important requirements:
+        {SECTION_BRIEFS[section].strip()}
+
+        Return only the {name} code without any explanations, in a single block:
+        ```{FENCE_LANGUAGES[section]}
+        [{name} code here]
+        ```
+        """
+
+
+def modify_fields(data):
+    if not data:
+        raise InvalidRequest('No JSON data received')
+
+    modification = data.get('modificationDescription')
+    current_html = data.get('currentHtml')
+    current_css = data.get('currentCss')
+    current_js = data.get('currentJs') or ''  # Optional JavaScript code
+
+    if not all([modification, current_html, current_css]):
+        raise InvalidRequest('Missing required fields')
+
+    return modification, current_html, current_css, current_js
+
+
+def modify_preamble(data):
+    # The instruction and current code, shared by full-file and patch modifies
+    modification, current_html, current_css, current_js = modify_fields(data)
+
+    return f"""
+        Modify this website according to this description: {modification}
+
+        Important:
+        1. Maintain or enhance any existing animations and visual effects
+        2. Ensure all gradient animations and visual styling remain intact
+        3. Keep the design modern, responsive and visually appealing
+        4. If adding new elements, match the existing style and add appropriate animations
+        5. Use high-quality placeholder images where needed (lorem picsum or unsplash URLs)
+        6. Ensure all interactive elements have proper hover/focus states
+
+        Current HTML:
+        ```html
+        {current_html}
+        ```
+
+        Current CSS:
+        ```css
+        {current_css}
+        ```
+
+        Current JavaScript:
+        ```javascript
+        {current_js}
+        ```
+"""
+
+
+def build_modify_prompt(data):
+    return modify_preamble(data) + """
+        Return only the modified HTML, CSS, and JavaScript code without any explanations.
+        Format the response exactly as:
+        ```html
+        [Modified HTML code here]
+        ```
+        ```css
+        [Modified CSS code here]
+        ```
+        ```javascript
+        [Modified JavaScript code here]
+        ```
+        Make sure the code is complete, functional, and properly handles user interactions.
+        The JavaScript code should be properly scoped and not interfere with the parent window.
+        """
+
+
+def build_patch_prompt(data):
+    return modify_preamble(data) + """
+        Do not return the full files. Return only the edits needed, as SEARCH/REPLACE blocks.
+        Put all edits for one file in a single fenced block tagged html, css or javascript,
+        and leave out files that do not change:
+        ```css
+        <<<<<<< SEARCH
+        [lines copied exactly from the current code]
+        =======
+        [replacement lines]
+        >>>>>>> REPLACE
+        ```
+        Each SEARCH must match the current code exactly, including indentation, and must
+        appear only once in that file; include a few surrounding lines if needed.
+        To add new code, SEARCH for the adjacent lines and repeat them in the replacement.
+        Keep the blocks as small as possible and return no explanations.
+        """
@@ -0,0 +1,176 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from backends import ModelBackend
+from metrics import hedges_total
+
+_EMPTY = object()
+
+
+def _chained(first, texts):
+    if first is not _EMPTY:
+        yield first
+    yield from texts
+
+
+async def _chained_async(first, texts):
+    if first is not _EMPTY:
+        yield first
+    async for text in texts:
+        yield text
+
+
+class HedgedBackend(ModelBackend):
+    """Sends a prompt a second time when the first request is slow to start.
+
+    If no chunk has arrived after the ``percentile`` of recent times to
+    first chunk (never less than ``min_delay``; ``initial_delay`` until
+    ``min_samples`` streams have been timed), the same prompt goes upstream
+    again and whichever stream produces a chunk first is used. The other
+    is closed. There is at most one hedge per request, so only the slowest
+    few percent of requests cost two upstream calls.
+    """
+
+    def __init__(self, backend, percentile=0.95, min_delay=1.0, initial_delay=5.0, window=200, min_samples=20):
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.settings = backend.settings
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._closers = set()
+
+    @classmethod
+    def from_env(cls, backend):
+        return cls(
+            backend,
+            percentile=float(os.getenv('HEDGE_PERCENTILE')) / 100,
+            min_delay=float(os.getenv('HEDGE_MIN_DELAY_S', '1')),
+            initial_delay=float(os.getenv('HEDGE_INITIAL_DELAY_S', '5')),
+        )
+
+    def delay(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, samples[min(len(samples) - 1, int(self.percentile * len(samples)))])
+
+    def _observe(self, started, attempts, winner):
+        with self._lock:
+            self._samples.append(time.monotonic() - started)
+        if attempts > 1:
+            hedges_total.inc('hedge' if winner else 'primary')
+
+    def _race(self, texts, index, results):
+        # The first next() runs on its own thread so the caller can time it out
+        def first():
+            try:
+                results.put((index, texts, next(texts, _EMPTY), None))
+            except Exception as e:
+                results.put((index, texts, None, e))
+
+        threading.Thread(target=first, daemon=True).start()
+
+    def _close_losers(self, results, count):
+        def close():
+            for _ in range(count):
+                _, texts, _, error = results.get()
+                if error is None:
+                    texts.close()
+
+        threading.Thread(target=close, daemon=True).start()
+
+    def stream(self, prompt):
+        # The primary is opened here, so errors opening it still raise from
+        # stream(); the race waits for the first next(), so opening several
+        # at once (sectioned mode) doesn't wait on each first chunk in turn
+        return self._hedged(prompt, self.backend.stream(prompt))
+
+    def _hedged(self, prompt, primary):
+        started = time.monotonic()
+        delay = self.delay()
+        results = queue.Queue()
+        self._race(primary, 0, results)
+        attempts = 1
+
+        try:
+            result = results.get(timeout=delay)
+        except queue.Empty:
+            print(f"No first chunk after {delay:.1f}s, hedging the upstream request")
+            try:
+                self._race(self.backend.stream(prompt), 1, results)
+                attempts = 2
+            except Exception as e:
+                print(f"Hedge request failed to open: {str(e)}")
+            result = results.get()
+
+        received = 1
+        # A failed attempt only loses if the other one can still start
+        while result[3] is not None and received < attempts:
+            result = results.get()
+            received += 1
+        if received < attempts:
+            self._close_losers(results, attempts - received)
+
+        winner, texts, first, error = result
+        if error is not None:
+            raise error
+        self._observe(started, attempts, winner)
+        yield from _chained(first, texts)
+
+    async def _first_async(self, index, texts):
+        try:
+            return index, texts, await texts.__anext__(), None
+        except StopAsyncIteration:
+            return index, texts, _EMPTY, None
+        except Exception as e:
+            return index, texts, None, e
+
+    async def _close_losers_async(self, tasks):
+        for task in tasks:
+            _, texts, _, error = await task
+            if error is None:
+                await texts.aclose()
+
+    async def stream_async(self, prompt):
+        import asyncio
+
+        started = time.monotonic()
+        delay = self.delay()
+        pending = {asyncio.ensure_future(self._first_async(0, await self.backend.stream_async(prompt)))}
+        attempts = 1
+
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            print(f"No first chunk after {delay:.1f}s, hedging the upstream request")
+            try:
+                pending.add(asyncio.ensure_future(self._first_async(1, await self.backend.stream_async(prompt))))
+                attempts = 2
+            except Exception as e:
+                print(f"Hedge request failed to open: {str(e)}")
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+        finished = list(done)
+        # A failed attempt only loses if the other one can still start
+        while all(task.result()[3] is not None for task in finished) and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished.extend(done)
+        chosen = next((task for task in finished if task.result()[3] is None), finished[0])
+        losers = [task for task in finished if task is not chosen] + list(pending)
+        if losers:
+            closer = asyncio.ensure_future(self._close_losers_async(losers))
+            self._closers.add(closer)
+            closer.add_done_callback(self._closers.discard)
+
+        result = chosen.result()
+        winner, texts, first, error = result
+        if error is not None:
+            raise error
+        self._observe(started, attempts, winner)
+        return _chained_async(first, texts)
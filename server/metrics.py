@@ -0,0 +1,224 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+GAP_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+TOKEN_BUCKETS = (64, 256, 1024, 4096, 16384, 65536)
+LOOKUP_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            named = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(named + [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(named)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(named)} {count}")
+        return '\n'.join(lines)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(list(zip(self.labelnames, labels)))} {value}")
+        return '\n'.join(lines)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name, documentation, buckets, labelnames=()):
+        metric = Histogram(name, documentation, buckets, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+registry = Registry()
+
+prompt_bytes = registry.histogram(
+    'instantcraft_prompt_bytes', 'Size of the prompt sent upstream', BYTE_BUCKETS, ('route',))
+prompt_tokens = registry.histogram(
+    'instantcraft_prompt_tokens', 'Estimated prompt tokens (bytes / 4)', TOKEN_BUCKETS, ('route',))
+first_chunk_seconds = registry.histogram(
+    'instantcraft_first_chunk_seconds', 'Time from request to first model chunk', LATENCY_BUCKETS, ('route', 'source'))
+chunk_gap_seconds = registry.histogram(
+    'instantcraft_chunk_gap_seconds', 'Time between consecutive model chunks', GAP_BUCKETS, ('route', 'source'))
+section_seconds = registry.histogram(
+    'instantcraft_section_complete_seconds', 'Time from request to a complete section', LATENCY_BUCKETS, ('route', 'section'))
+stream_seconds = registry.histogram(
+    'instantcraft_stream_duration_seconds', 'Total stream duration', LATENCY_BUCKETS, ('route', 'outcome'))
+write_seconds = registry.histogram(
+    'instantcraft_stream_write_seconds', 'Time an SSE response spent writing to the client', LATENCY_BUCKETS)
+output_bytes = registry.histogram(
+    'instantcraft_output_bytes', 'Model output size', BYTE_BUCKETS, ('route',))
+streams_total = registry.counter(
+    'instantcraft_streams_total', 'Finished streams by outcome and error class', ('route', 'outcome', 'error'))
+queue_seconds = registry.histogram(
+    'instantcraft_queue_seconds', 'Time a generation waited for a scheduler slot', LATENCY_BUCKETS)
+shed_total = registry.counter(
+    'instantcraft_shed_total', 'Generations refused because the queue was full')
+similar_lookup_seconds = registry.histogram(
+    'instantcraft_similar_lookup_seconds', 'Near-duplicate description index lookup time', LOOKUP_BUCKETS)
+similar_lookups_total = registry.counter(
+    'instantcraft_similar_lookups_total', 'Near-duplicate description lookups by result', ('result',))
+hedges_total = registry.counter(
+    'instantcraft_upstream_hedges_total', 'Hedged upstream requests by which attempt started first', ('winner',))
+exports_total = registry.counter(
+    'instantcraft_exports_total', 'Project ZIP exports by whether the export cache had them', ('cache',))
+export_build_seconds = registry.histogram(
+    'instantcraft_export_build_seconds', 'Time to minify, prune and zip a project export', LATENCY_BUCKETS)
+
+
+class JsonLinesLog:
+    # METRICS_LOG=<path> appends one JSON object per request; "-" is stdout
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            if self.path == '-':
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            else:
+                with open(self.path, 'a') as f:
+                    f.write(line)
+
+
+request_log = JsonLinesLog(os.environ['METRICS_LOG']) if os.getenv('METRICS_LOG') else None
+
+
+class RequestTimer:
+    """Timing for one generation request, from route entry to last event.
+
+    The streaming loop calls ``chunk`` and ``section_end`` for each
+    upstream chunk and finished section; these only do arithmetic and a
+    histogram bucket increment. Everything else is recorded once, in
+    ``finish``. Time spent writing to the client is not the generation's:
+    with resumable streams there may be several clients or none, so the
+    SSE encoder records it per response in ``write_seconds``.
+    """
+
+    def __init__(self, route):
+        self.route = route
+        self.source = 'upstream'
+        self.started = time.perf_counter()
+        self.prompt_bytes = 0
+        self.first_chunk = None
+        self.last_chunk = None
+        self.max_gap = 0.0
+        self.chunks = 0
+        self.output_bytes = 0
+        self.sections = {}
+        self.finished = False
+
+    def prompt(self, prompt, source='upstream'):
+        self.prompt_bytes += len(prompt.encode())
+        self.source = source
+
+    def chunk(self, text):
+        now = time.perf_counter()
+        if self.last_chunk is None:
+            self.first_chunk = now - self.started
+        else:
+            gap = now - self.last_chunk
+            self.max_gap = max(self.max_gap, gap)
+            chunk_gap_seconds.observe(gap, self.route, self.source)
+        self.last_chunk = now
+        self.chunks += 1
+        self.output_bytes += len(text)
+
+    def section_end(self, section):
+        self.sections.setdefault(section, time.perf_counter() - self.started)
+
+    def finish(self, outcome='ok', error=None):
+        if self.finished:
+            return
+        self.finished = True
+        duration = time.perf_counter() - self.started
+        error_class = type(error).__name__ if error is not None else ''
+
+        if self.prompt_bytes:
+            prompt_bytes.observe(self.prompt_bytes, self.route)
+            prompt_tokens.observe(self.prompt_bytes / 4, self.route)
+        if self.first_chunk is not None:
+            first_chunk_seconds.observe(self.first_chunk, self.route, self.source)
+        for section, seconds in self.sections.items():
+            section_seconds.observe(seconds, self.route, section)
+        stream_seconds.observe(duration, self.route, outcome)
+        output_bytes.observe(self.output_bytes, self.route)
+        streams_total.inc(self.route, outcome, error_class)
+
+        if request_log is not None:
+            request_log.write({
+                'route': self.route,
+                'source': self.source,
+                'outcome': outcome,
+                'error': error_class or None,
+                'prompt_bytes': self.prompt_bytes,
+                'first_chunk_s': self.first_chunk,
+                'max_chunk_gap_s': self.max_gap,
+                'chunks': self.chunks,
+                'sections_s': self.sections,
+                'duration_s': duration,
+                'output_bytes': self.output_bytes,
+            })
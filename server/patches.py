@@ -0,0 +1,132 @@
+import re
+from generation import build_modify_prompt, build_patch_prompt, modify_fields
+from section_parser import FENCE_LANGUAGES, SECTIONS, SectionStreamParser
+
+EDIT_BLOCK = re.compile(r'<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE', re.S)
+
+
+class PatchError(ValueError):
+    pass
+
+
+def parse_edits(text):
+    # Split a patch-mode response into {section: [(search, replace), ...]}
+    parser = SectionStreamParser()
+    blocks = {}
+    for event in parser.feed(text) + parser.close():
+        if event['type'] == 'delta':
+            blocks[event['section']] = blocks.get(event['section'], '') + event['text']
+
+    edits = {section: EDIT_BLOCK.findall(block) for section, block in blocks.items()}
+    if not any(edits.values()):
+        raise PatchError('response contained no SEARCH/REPLACE blocks')
+    return edits
+
+
+def _replace_loose(source, search, replace):
+    # Same lines modulo indentation/trailing whitespace, still required unique
+    lines = source.split('\n')
+    wanted = [line.strip() for line in search.strip('\n').split('\n')]
+    matches = [
+        start for start in range(len(lines) - len(wanted) + 1)
+        if [line.strip() for line in lines[start:start + len(wanted)]] == wanted
+    ]
+    if len(matches) != 1:
+        raise PatchError(f"SEARCH text matched {len(matches)} places")
+    start = matches[0]
+    return '\n'.join(lines[:start] + replace.split('\n') + lines[start + len(wanted):])
+
+
+def apply_edits(source, edits):
+    for search, replace in edits:
+        if not search.strip():
+            if source.strip():
+                raise PatchError('empty SEARCH against a non-empty file')
+            source = replace
+            continue
+
+        count = source.count(search)
+        if count == 1:
+            source = source.replace(search, replace, 1)
+        elif count > 1:
+            raise PatchError(f"SEARCH text matched {count} places")
+        else:
+            source = _replace_loose(source, search, replace)
+    return source
+
+
+def apply_response(current, text):
+    patched = dict(current)
+    for section, edits in parse_edits(text).items():
+        patched[section] = apply_edits(current[section], edits)
+    return patched
+
+
+def fenced(section, code):
+    return f"```{FENCE_LANGUAGES[section]}\n{code}\n```\n"
+
+
+def current_sections(data):
+    _, current_html, current_css, current_js = modify_fields(data)
+    return {'html': current_html, 'css': current_css, 'js': current_js}
+
+
+def _changed(current, patched, complete):
+    return [section for section in SECTIONS if complete or patched[section] != current[section]]
+
+
+def patched_texts(current, texts, fallback, complete=False):
+    """Apply a patch-mode response to ``current`` and yield the result.
+
+    Output uses the same fenced format as a full generation, but only for
+    the sections that changed (every section with ``complete``, for clients
+    that start from nothing), so it goes through the normal SSE path. If
+    any edit fails to apply, ``fallback()`` is streamed instead.
+    """
+    text = ''.join(texts)
+    try:
+        patched = apply_response(current, text)
+    except PatchError as e:
+        print(f"Patch did not apply ({str(e)}), regenerating the full site")
+        yield from fallback()
+        return
+
+    for section in _changed(current, patched, complete):
+        yield fenced(section, patched[section])
+
+
+async def patched_texts_async(current, texts, fallback, complete=False):
+    text = ''.join([chunk async for chunk in texts])
+    try:
+        patched = apply_response(current, text)
+    except PatchError as e:
+        print(f"Patch did not apply ({str(e)}), regenerating the full site")
+        async for chunk in await fallback():
+            yield chunk
+        return
+
+    for section in _changed(current, patched, complete):
+        yield fenced(section, patched[section])
+
+
+def modify_texts(data, generation_texts, complete=False):
+    # generation_texts(prompt) opens the (cached/coalesced) model stream
+    if data and data.get('mode') == 'patch':
+        return patched_texts(
+            current_sections(data),
+            generation_texts(build_patch_prompt(data)),
+            lambda: generation_texts(build_modify_prompt(data)),
+            complete
+        )
+    return generation_texts(build_modify_prompt(data))
+
+
+async def modify_texts_async(data, generation_texts, complete=False):
+    if data and data.get('mode') == 'patch':
+        return patched_texts_async(
+            current_sections(data),
+            await generation_texts(build_patch_prompt(data)),
+            lambda: generation_texts(build_modify_prompt(data)),
+            complete
+        )
+    return await generation_texts(build_modify_prompt(data))
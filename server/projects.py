@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from generation import InvalidRequest
+from section_parser import SECTIONS
+
+PROJECT_ID = re.compile(r'[0-9a-f]{32}')
+REVISION = re.compile(r'[0-9a-f]{16}')
+
+
+class UnknownProject(KeyError):
+    pass
+
+
+class RevisionConflict(Exception):
+    def __init__(self, head):
+        super().__init__(f"Project is at revision {head}")
+        self.head = head
+
+
+def revision_of(sections):
+    payload = json.dumps([sections.get(section, '') for section in SECTIONS])
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+class ProjectStore:
+    """Generated sites saved under a project id as content-hashed revisions.
+
+    Each project has a head revision; ``commit`` only moves the head forward
+    from the revision the caller based its change on, so a stale client gets
+    ``RevisionConflict`` instead of overwriting newer work. Backends provide
+    revision storage and an atomic compare-and-set of the head.
+    """
+
+    def _read_head(self, project_id):
+        raise NotImplementedError
+
+    def _swap_head(self, project_id, expected, revision):
+        raise NotImplementedError
+
+    def _read_revision(self, project_id, revision):
+        raise NotImplementedError
+
+    def _write_revision(self, project_id, revision, sections):
+        raise NotImplementedError
+
+    def _has_revision(self, project_id, revision):
+        return self._read_revision(project_id, revision) is not None
+
+    def head(self, project_id):
+        head = self._read_head(project_id) if PROJECT_ID.fullmatch(project_id or '') else None
+        if head is None:
+            raise UnknownProject(project_id)
+        return head
+
+    def get(self, project_id, revision=None):
+        # Both ids are checked before a backend sees them; the filesystem
+        # store builds paths from them
+        if not PROJECT_ID.fullmatch(project_id or ''):
+            raise UnknownProject(project_id)
+        revision = revision or self.head(project_id)
+        sections = self._read_revision(project_id, revision) if REVISION.fullmatch(revision) else None
+        if sections is None:
+            raise UnknownProject(project_id)
+        return sections
+
+    def revision(self, project_id, revision=None):
+        """``revision``, or the head if it is None, once the project and that
+        revision are both known to exist; otherwise ``UnknownProject``."""
+        head = self.head(project_id)
+        if revision is None or revision == head:
+            return head
+        if not REVISION.fullmatch(revision) or not self._has_revision(project_id, revision):
+            raise UnknownProject(project_id)
+        return revision
+
+    def create(self, sections):
+        project_id = os.urandom(16).hex()
+        revision = revision_of(sections)
+        self._write_revision(project_id, revision, sections)
+        self._swap_head(project_id, None, revision)
+        return project_id, revision
+
+    def commit(self, project_id, base_revision, sections):
+        head = self.head(project_id)
+        if head != base_revision:
+            raise RevisionConflict(head)
+        revision = revision_of(sections)
+        if revision == head:
+            return revision
+        self._write_revision(project_id, revision, sections)
+        if not self._swap_head(project_id, base_revision, revision):
+            raise RevisionConflict(self.head(project_id))
+        return revision
+
+
+class MemoryProjectStore(ProjectStore):
+    """Projects kept in this process only, for development and single servers.
+
+    At most ``max_projects`` are kept; past that, whole projects are
+    dropped least recently used first (reads count as use) and then behave
+    as unknown. Use the sqlite or filesystem store to keep them all.
+    """
+
+    def __init__(self, max_projects=1000):
+        self.max_projects = max_projects
+        # project id -> [head, {revision: sections}], least recently used first
+        self._projects = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _project(self, project_id):
+        # Caller holds the lock
+        project = self._projects.get(project_id)
+        if project is not None:
+            self._projects.move_to_end(project_id)
+        return project
+
+    def _read_head(self, project_id):
+        with self._lock:
+            project = self._project(project_id)
+            return project[0] if project is not None else None
+
+    def _swap_head(self, project_id, expected, revision):
+        with self._lock:
+            project = self._project(project_id)
+            if project is None or project[0] != expected:
+                return False
+            project[0] = revision
+            return True
+
+    def _read_revision(self, project_id, revision):
+        with self._lock:
+            project = self._project(project_id)
+            return project[1].get(revision) if project is not None else None
+
+    def _write_revision(self, project_id, revision, sections):
+        with self._lock:
+            project = self._project(project_id)
+            if project is None:
+                project = self._projects[project_id] = [None, {}]
+                while len(self._projects) > max(self.max_projects, 1):
+                    self._projects.popitem(last=False)
+            project[1][revision] = dict(sections)
+
+
+class SqliteProjectStore(ProjectStore):
+    def __init__(self, path):
+        import sqlite3
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS projects (id TEXT PRIMARY KEY, head TEXT NOT NULL)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS revisions ('
+                'project_id TEXT, revision TEXT, html TEXT, css TEXT, js TEXT, '
+                'PRIMARY KEY (project_id, revision))'
+            )
+
+    def _read_head(self, project_id):
+        with self._lock:
+            row = self._conn.execute('SELECT head FROM projects WHERE id = ?', (project_id,)).fetchone()
+        return row[0] if row else None
+
+    def _swap_head(self, project_id, expected, revision):
+        with self._lock:
+            if expected is None:
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO projects (id, head) VALUES (?, ?)', (project_id, revision))
+            else:
+                cursor = self._conn.execute(
+                    'UPDATE projects SET head = ? WHERE id = ? AND head = ?', (revision, project_id, expected))
+            return cursor.rowcount == 1
+
+    def _read_revision(self, project_id, revision):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT html, css, js FROM revisions WHERE project_id = ? AND revision = ?',
+                (project_id, revision)
+            ).fetchone()
+        return dict(zip(SECTIONS, row)) if row else None
+
+    def _has_revision(self, project_id, revision):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM revisions WHERE project_id = ? AND revision = ?', (project_id, revision)).fetchone()
+        return row is not None
+
+    def _write_revision(self, project_id, revision, sections):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO revisions (project_id, revision, html, css, js) VALUES (?, ?, ?, ?, ?)',
+                (project_id, revision, *(sections.get(section, '') for section in SECTIONS))
+            )
+
+
+class DirectoryProjectStore(ProjectStore):
+    # One directory per project: a HEAD file plus <revision>.json per revision.
+    # The head lock is per process, so don't share a directory between servers.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _write_file(self, path, content):
+        import tempfile
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _read_head(self, project_id):
+        try:
+            with open(os.path.join(self.path, project_id, 'HEAD')) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _swap_head(self, project_id, expected, revision):
+        with self._lock:
+            if self._read_head(project_id) != expected:
+                return False
+            self._write_file(os.path.join(self.path, project_id, 'HEAD'), revision)
+            return True
+
+    def _read_revision(self, project_id, revision):
+        try:
+            with open(os.path.join(self.path, project_id, f"{revision}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _has_revision(self, project_id, revision):
+        return os.path.exists(os.path.join(self.path, project_id, f"{revision}.json"))
+
+    def _write_revision(self, project_id, revision, sections):
+        os.makedirs(os.path.join(self.path, project_id), exist_ok=True)
+        self._write_file(os.path.join(self.path, project_id, f"{revision}.json"), json.dumps(sections))
+
+
+def open_project_store():
+    kind = os.getenv('PROJECT_STORE', 'memory')
+    if kind == 'sqlite':
+        return SqliteProjectStore(os.getenv('PROJECT_STORE_PATH', 'projects.db'))
+    if kind == 'filesystem':
+        return DirectoryProjectStore(os.getenv('PROJECT_STORE_PATH', 'projects'))
+    if kind == 'memory':
+        return MemoryProjectStore(int(os.getenv('PROJECT_STORE_MAX', '1000')))
+    raise ValueError(f"Unknown PROJECT_STORE: {kind}")
+
+
+def resolve_modify_request(store, data, if_match=None):
+    """Fill a ``projectId`` modify request in with the stored source.
+
+    Returns ``(data, project_id, base_revision)``; requests that upload the
+    code themselves pass through with no project.
+    """
+    if not data or not data.get('projectId'):
+        return data, None, None
+
+    project_id = data['projectId']
+    base_revision = data.get('baseRevision') or (if_match or '').strip('"') or None
+    head = store.head(project_id)
+    if base_revision is None:
+        raise InvalidRequest('baseRevision is required with projectId')
+    if base_revision != head:
+        raise RevisionConflict(head)
+
+    sections = store.get(project_id, head)
+    return {
+        **data,
+        'currentHtml': sections['html'],
+        'currentCss': sections['css'],
+        'currentJs': sections['js'],
+    }, project_id, head
+
+
+def project_saver(store, data=None, project_id=None, base_revision=None):
+    # on_complete hook for section_events: save the finished site and report
+    # where it lives in the done event
+    data = data or {}
+    base = {
+        'html': data.get('currentHtml') or '',
+        'css': data.get('currentCss') or '',
+        'js': data.get('currentJs') or '',
+    }
+
+    def on_complete(sections):
+        site = {section: sections[section].strip() if section in sections else base[section]
+                for section in SECTIONS}
+        if project_id is None:
+            new_id, revision = store.create(site)
+            return {'projectId': new_id, 'revision': revision}
+        return {'projectId': project_id, 'revision': store.commit(project_id, base_revision, site)}
+
+    return on_complete
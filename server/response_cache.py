@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    # Prompts that only differ in whitespace produce the same site
+    return ' '.join(prompt.split())
+
+
+def cache_key(prompt, model_name, settings):
+    payload = json.dumps({
+        'prompt': normalize_prompt(prompt),
+        'model': model_name,
+        'config': settings,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed store of completed model responses.
+
+    Entries are the raw text chunks of a finished generation, so a hit can
+    be fed through the section parser again and produce the same SSE events
+    as the original stream. Memory is an LRU bounded by entry count and total
+    bytes; ``directory`` adds an on-disk store that survives restarts and is
+    consulted on memory misses. Both honour ``ttl`` (seconds). The directory
+    is held to the same limits, by file size and least recently read or
+    written first, each time an entry is written to it.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=3600, directory=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv('RESPONSE_CACHE_ENTRIES', '256')),
+            max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            ttl=float(os.getenv('RESPONSE_CACHE_TTL', '3600')),
+            directory=os.getenv('RESPONSE_CACHE_DIR') or None,
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl
+
+    def _store(self, key, created, chunks):
+        size = sum(len(text) for text in chunks)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (created, chunks, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry['created']):
+            _remove(path)
+            return None
+        # The mtime is what the directory sweep orders entries by
+        _touch(path)
+        self._store(key, entry['created'], entry['chunks'])
+        return entry['chunks']
+
+    def _sweep_directory(self):
+        # Other processes may share the directory and remove files under us
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # An entry is at least as old as its mtime; a .tmp this old was
+            # left behind by a crashed write
+            if self._expired(stat.st_mtime):
+                _remove(path)
+            elif name.endswith('.json'):
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        count, total = len(entries), sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            _remove(path)
+            count -= 1
+            total -= size
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                self._bytes -= self._entries.pop(key)[2]
+        if self.directory:
+            return self._load(key)
+        return None
+
+    def put(self, key, chunks):
+        if not self.enabled or not chunks:
+            return
+        created = time.time()
+        self._store(key, created, chunks)
+        if self.directory:
+            # Write then rename so readers never see a half-written entry
+            import tempfile
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'created': created, 'chunks': chunks}, f)
+            os.replace(tmp_path, self._path(key))
+            self._sweep_directory()
+
+    def record(self, key, texts):
+        # Pass chunks through, caching them only if the stream runs to the end
+        chunks = []
+        for text in texts:
+            chunks.append(text)
+            yield text
+        self.put(key, chunks)
+
+    async def record_async(self, key, texts):
+        chunks = []
+        async for text in texts:
+            chunks.append(text)
+            yield text
+        self.put(key, chunks)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def replay(chunks):
+    yield from chunks
+
+
+async def replay_async(chunks):
+    for text in chunks:
+        yield text
@@ -0,0 +1,266 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from generation import InvalidRequest
+
+
+class UnknownStream(KeyError):
+    pass
+
+
+class StreamExpired(Exception):
+    # The events after Last-Event-ID have already left the replay buffer
+    pass
+
+
+def last_event_id(value):
+    # Last-Event-ID is the seq of the last event the client got; none means all
+    if not value:
+        return 0
+    try:
+        return max(0, int(value))
+    except ValueError:
+        raise InvalidRequest('Last-Event-ID must be an event sequence number')
+
+
+class ResumableStream:
+    """Section events of one generation, kept for clients that reconnect.
+
+    A pump thread drains ``events`` into a ring of the last ``capacity``
+    events, so the generation carries on while no client is attached.
+    ``follow(last_seq)`` replays what is still buffered after ``last_seq``
+    and then follows live output. Once nobody has been attached for
+    ``grace`` seconds the upstream is closed at the next event.
+    """
+
+    def __init__(self, stream_id, events, capacity=2048, grace=30.0):
+        self.stream_id = stream_id
+        self.grace = grace
+        self.buffer = deque(maxlen=capacity)
+        self.seq = 0
+        self.finished = False
+        self.finished_at = None
+        self.attached = 0
+        self.detached_at = time.monotonic()
+        self._events = events
+        self._cond = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def _abandoned(self, now):
+        return not self.attached and now - self.detached_at > self.grace
+
+    def abandoned(self):
+        return self._abandoned(time.monotonic())
+
+    def expired(self, now):
+        return (self.finished and not self.attached
+                and now - max(self.finished_at, self.detached_at) > self.grace)
+
+    def _append(self, event):
+        self.buffer.append(event)
+        self.seq = event.get('seq', self.seq)
+        return self._abandoned(time.monotonic())
+
+    def _replay(self, last_seq):
+        # Buffered events after last_seq, or None if some were already dropped
+        start = last_seq - (self.seq - len(self.buffer))
+        if start < 0:
+            return None
+        return list(itertools.islice(self.buffer, start, None))
+
+    def _check(self, last_seq):
+        if last_seq < self.seq - len(self.buffer):
+            raise StreamExpired(self.stream_id)
+
+    def _pump(self):
+        try:
+            for event in self._events:
+                with self._cond:
+                    abandoned = self._append(event)
+                    self._cond.notify_all()
+                if abandoned:
+                    print(f"Stream {self.stream_id} abandoned, closing the generation")
+                    break
+        finally:
+            # Closing mid-stream ends section_events as 'disconnected'
+            self._events.close()
+            with self._cond:
+                self.finished = True
+                self.finished_at = time.monotonic()
+                self._cond.notify_all()
+
+    def follow(self, last_seq=0):
+        # Checked here rather than in the generator so the route can still
+        # answer 410 instead of starting a stream it can't serve
+        with self._cond:
+            self._check(last_seq)
+        return Following(self, last_seq)
+
+    def _follow(self, last_seq, following):
+        with self._cond:
+            self.attached += 1
+        try:
+            while True:
+                with self._cond:
+                    while last_seq >= self.seq and not self.finished and not following.closed:
+                        self._cond.wait()
+                    if following.closed:
+                        return
+                    pending = self._replay(last_seq)
+                    finished = self.finished
+                if pending is None:
+                    yield {'type': 'error', 'error': 'Client fell too far behind the generation'}
+                    return
+                for event in pending:
+                    yield event
+                if pending:
+                    last_seq = pending[-1]['seq']
+                if finished:
+                    return
+        finally:
+            with self._cond:
+                self.attached -= 1
+                if not self.attached:
+                    self.detached_at = time.monotonic()
+
+
+class Following:
+    """One client's iterator over a ``ResumableStream``.
+
+    The SSE encoder reads it on a helper thread, which may be waiting for
+    the next event when the client goes; ``close()`` can be called from
+    the response's thread and detaches the client straight away.
+    """
+
+    def __init__(self, stream, last_seq):
+        self.stream = stream
+        self.closed = False
+        self._events = stream._follow(last_seq, self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        with self.stream._cond:
+            self.closed = True
+            self.stream._cond.notify_all()
+        try:
+            self._events.close()
+        except ValueError:
+            # Running on the reader thread; it sees closed and returns
+            pass
+
+
+class AsyncResumableStream(ResumableStream):
+    """Event-loop version of ``ResumableStream``; ``events`` is an async
+    iterator and the pump runs as a task."""
+
+    def __init__(self, stream_id, events, capacity=2048, grace=30.0):
+        super().__init__(stream_id, events, capacity, grace)
+        self._cond = asyncio.Condition()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        try:
+            async for event in self._events:
+                async with self._cond:
+                    abandoned = self._append(event)
+                    self._cond.notify_all()
+                if abandoned:
+                    print(f"Stream {self.stream_id} abandoned, closing the generation")
+                    break
+        finally:
+            await self._events.aclose()
+            async with self._cond:
+                self.finished = True
+                self.finished_at = time.monotonic()
+                self._cond.notify_all()
+
+    def follow(self, last_seq=0):
+        # Everything runs on one loop, so no lock is needed to check
+        self._check(last_seq)
+        return self._follow(last_seq)
+
+    async def _follow(self, last_seq):
+        self.attached += 1
+        try:
+            while True:
+                async with self._cond:
+                    await self._cond.wait_for(lambda: last_seq < self.seq or self.finished)
+                    pending = self._replay(last_seq)
+                    finished = self.finished
+                if pending is None:
+                    yield {'type': 'error', 'error': 'Client fell too far behind the generation'}
+                    return
+                for event in pending:
+                    yield event
+                if pending:
+                    last_seq = pending[-1]['seq']
+                if finished:
+                    return
+        finally:
+            self.attached -= 1
+            if not self.attached:
+                self.detached_at = time.monotonic()
+
+
+class StreamRegistry:
+    """Open and recently finished generation streams by stream id.
+
+    Streams stay resumable for ``grace`` seconds after they finish or lose
+    their last client; ``RESUME_BUFFER_EVENTS`` and ``RESUME_GRACE_S`` set
+    the ring size and grace period.
+    """
+
+    stream_class = ResumableStream
+
+    def __init__(self, capacity=2048, grace=30.0):
+        self.capacity = capacity
+        self.grace = grace
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            capacity=int(os.getenv('RESUME_BUFFER_EVENTS', '2048')),
+            grace=float(os.getenv('RESUME_GRACE_S', '30')),
+        )
+
+    def _sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            for stream_id, stream in list(self._streams.items()):
+                if stream.expired(now):
+                    del self._streams[stream_id]
+
+    def open(self, events):
+        self._sweep()
+        stream = self.stream_class(os.urandom(16).hex(), events, self.capacity, self.grace)
+        with self._lock:
+            self._streams[stream.stream_id] = stream
+        stream.start()
+        return stream
+
+    def get(self, stream_id):
+        self._sweep()
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        if stream is None:
+            raise UnknownStream(stream_id)
+        return stream
+
+
+class AsyncStreamRegistry(StreamRegistry):
+    stream_class = AsyncResumableStream
@@ -0,0 +1,262 @@
+import asyncio
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from metrics import queue_seconds, shed_total
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Too many generations queued, try again shortly')
+        self.retry_after = retry_after
+
+
+def client_id(forwarded_for, remote_addr, trusted_proxies=0):
+    # Clients can send any X-Forwarded-For they like, so only the hops our
+    # own ``trusted_proxies`` appended count: the last of those is the
+    # address the outermost proxy saw. Without proxies it is the peer.
+    hops = [hop.strip() for hop in (forwarded_for or '').split(',') if hop.strip()]
+    if trusted_proxies and hops:
+        return hops[max(0, len(hops) - trusted_proxies)]
+    return remote_addr or 'unknown'
+
+
+class Ticket:
+    def __init__(self, client, signal):
+        self.client = client
+        self.signal = signal
+        self.granted = False
+        self.released = False
+        self.created = time.perf_counter()
+        # Set by the route once the ticket's stream exists; true once its
+        # client has been gone for longer than the resume grace period
+        self.abandoned = None
+
+    def gone(self):
+        return self.abandoned is not None and self.abandoned()
+
+
+class Scheduler:
+    """Admission control and fair queueing in front of the model calls.
+
+    At most ``max_active`` generations run at once and at most
+    ``max_per_client`` of them for any one client. Requests beyond that
+    wait in a lane per client, and lanes are served round-robin, so a
+    client sending a burst only delays its own requests. Once
+    ``max_queued`` requests are waiting, ``admit`` refuses new ones with
+    ``Overloaded`` rather than letting them pile up against the quota.
+
+    Clients are told apart by address; behind proxies set
+    ``trusted_proxies`` to how many append to X-Forwarded-For.
+    """
+
+    signal_class = threading.Event
+    # How often a queued ticket checks whether its client is still there
+    poll_interval = 1.0
+
+    def __init__(self, max_active=16, max_per_client=2, max_queued=64, retry_after=5, trusted_proxies=0):
+        self.max_active = max_active
+        self.max_per_client = max_per_client
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+        self.trusted_proxies = trusted_proxies
+        self.active = 0
+        self.queued = 0
+        self._active_by_client = {}
+        self._lanes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_active=int(os.getenv('MAX_ACTIVE_GENERATIONS', '16')),
+            max_per_client=int(os.getenv('MAX_GENERATIONS_PER_CLIENT', '2')),
+            max_queued=int(os.getenv('MAX_QUEUED_GENERATIONS', '64')),
+            retry_after=int(os.getenv('QUEUE_RETRY_AFTER_S', '5')),
+            trusted_proxies=int(os.getenv('TRUSTED_PROXIES', '0')),
+        )
+
+    def _can_start(self, client):
+        return (self.active < self.max_active
+                and self._active_by_client.get(client, 0) < self.max_per_client)
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        ticket.signal.set()
+        self.active += 1
+        self._active_by_client[ticket.client] = self._active_by_client.get(ticket.client, 0) + 1
+        queue_seconds.observe(time.perf_counter() - ticket.created)
+
+    def _dispatch(self):
+        # One ticket per lane per pass; a lane that was served moves to the back
+        progress = True
+        while progress and self.active < self.max_active:
+            progress = False
+            for client in list(self._lanes):
+                if not self._can_start(client):
+                    continue
+                lane = self._lanes[client]
+                self._grant(lane.popleft())
+                self.queued -= 1
+                if lane:
+                    self._lanes.move_to_end(client)
+                else:
+                    del self._lanes[client]
+                progress = True
+
+    def _notify(self):
+        for lane in self._lanes.values():
+            for ticket in lane:
+                ticket.signal.set()
+
+    def admit(self, client):
+        with self._lock:
+            ticket = Ticket(client, self.signal_class())
+            if client not in self._lanes and self._can_start(client):
+                self._grant(ticket)
+                return ticket
+            if self.queued >= self.max_queued:
+                shed_total.inc()
+                raise Overloaded(self.retry_after)
+            self._lanes.setdefault(client, deque()).append(ticket)
+            self.queued += 1
+            return ticket
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.granted:
+                self.active -= 1
+                self._active_by_client[ticket.client] -= 1
+                if not self._active_by_client[ticket.client]:
+                    del self._active_by_client[ticket.client]
+            else:
+                lane = self._lanes[ticket.client]
+                lane.remove(ticket)
+                self.queued -= 1
+                if not lane:
+                    del self._lanes[ticket.client]
+            self._dispatch()
+            self._notify()
+
+    def position(self, ticket):
+        """1-based place in the round-robin order, or None once granted."""
+        with self._lock:
+            if ticket.granted or ticket.released:
+                return None
+            lanes = list(self._lanes.values())
+            lane = self._lanes[ticket.client]
+            index = lane.index(ticket)
+            own = lanes.index(lane)
+            ahead = sum(min(len(other), index + 1 if i < own else index) for i, other in enumerate(lanes))
+            return ahead + 1
+
+    def wait(self, ticket):
+        # Yields the ticket's queue position whenever it changes, until it is
+        # granted, or released because its client went away while queued
+        last = None
+        while True:
+            ticket.signal.clear()
+            position = self.position(ticket)
+            if position is None:
+                return
+            if position != last:
+                last = position
+                yield position
+            if not ticket.signal.wait(self.poll_interval) and ticket.gone():
+                self.release(ticket)
+                return
+
+
+class AsyncScheduler(Scheduler):
+    # Everything runs on the event loop, so the waits are asyncio events
+
+    signal_class = asyncio.Event
+
+    async def wait_async(self, ticket):
+        last = None
+        while True:
+            ticket.signal.clear()
+            position = self.position(ticket)
+            if position is None:
+                return
+            if position != last:
+                last = position
+                yield position
+            try:
+                await asyncio.wait_for(ticket.signal.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                if ticket.gone():
+                    self.release(ticket)
+                    return
+
+
+def _renumbered(event, offset):
+    if offset and 'seq' in event:
+        event['seq'] += offset
+    return event
+
+
+def _open_failed(e, seq, timer):
+    print(f"Error opening the generation: {str(e)}")
+    traceback.print_exc()
+    if timer is not None:
+        timer.finish('error', e)
+    return {'seq': seq + 1, 'type': 'error', 'error': str(e)}
+
+
+def _withdrawn(timer):
+    print("Client left while queued, giving up its place")
+    if timer is not None:
+        timer.finish('disconnected')
+
+
+def admitted_events(scheduler, ticket, open_events, timer=None):
+    """Queue-position events until ``ticket`` gets a slot, then the generation.
+
+    ``open_events()`` only runs once the ticket is granted, so queued
+    requests never reach the model, and not at all if the client went away
+    while it was queued. ``queued`` events take the first seqs and the
+    generation's own events are shifted after them.
+    """
+    seq = 0
+    try:
+        for position in scheduler.wait(ticket):
+            seq += 1
+            yield {'seq': seq, 'type': 'queued', 'position': position}
+        if ticket.released:
+            _withdrawn(timer)
+            return
+        try:
+            events = open_events()
+        except Exception as e:
+            yield _open_failed(e, seq, timer)
+            return
+        for event in events:
+            yield _renumbered(event, seq)
+    finally:
+        scheduler.release(ticket)
+
+
+async def admitted_events_async(scheduler, ticket, open_events, timer=None):
+    seq = 0
+    try:
+        async for position in scheduler.wait_async(ticket):
+            seq += 1
+            yield {'seq': seq, 'type': 'queued', 'position': position}
+        if ticket.released:
+            _withdrawn(timer)
+            return
+        try:
+            events = await open_events()
+        except Exception as e:
+            yield _open_failed(e, seq, timer)
+            return
+        async for event in events:
+            yield _renumbered(event, seq)
+    finally:
+        scheduler.release(ticket)
@@ -0,0 +1,137 @@
+FENCE = '```'
+CLOSING_FENCE = '\n' + FENCE
+
+# Fence info strings the model uses for each section of the site
+SECTION_LANGUAGES = {
+    'html': 'html',
+    'css': 'css',
+    'javascript': 'js',
+    'js': 'js',
+}
+
+SECTIONS = ('html', 'css', 'js')
+
+# Fence info string written for each section when we produce responses
+FENCE_LANGUAGES = {
+    'html': 'html',
+    'css': 'css',
+    'js': 'javascript',
+}
+
+
+def _held_back(text, pattern):
+    # Length of the longest suffix of text that is a proper prefix of pattern,
+    # i.e. how much we must keep buffered because it may turn into the pattern.
+    for size in range(min(len(pattern) - 1, len(text)), 0, -1):
+        if pattern.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class SectionStreamParser:
+    """Single-pass parser turning raw model text into typed section events.
+
+    Text is fed in arbitrary chunks and every character is inspected a
+    bounded number of times, so the cost is linear in the response length.
+    Events are dicts with a monotonically increasing ``seq``:
+
+    - ``{'type': 'delta', 'section': 'html', 'text': ...}``
+    - ``{'type': 'section_end', 'section': 'html'}``
+    - ``{'type': 'done'}`` (from ``close``)
+    - ``{'type': 'error', 'error': ...}`` (from ``fail``)
+
+    Like the old client-side regexes, only the first fenced block of each
+    kind is used; later blocks and unknown languages are skipped.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._seq = 0
+        self._in_fence = False
+        self._section = None
+        self._at_line_start = True
+        self._seen = set()
+        self._closed = False
+
+    def _event(self, payload):
+        self._seq += 1
+        payload['seq'] = self._seq
+        return payload
+
+    def _emit_text(self, events, text):
+        if not text:
+            return
+        self._at_line_start = text.endswith('\n')
+        if self._section is not None:
+            events.append(self._event({'type': 'delta', 'section': self._section, 'text': text}))
+
+    def _open_fence(self, language):
+        self._in_fence = True
+        self._at_line_start = True
+        section = SECTION_LANGUAGES.get(language.strip().lower())
+        self._section = section if section not in self._seen else None
+
+    def _close_fence(self, events):
+        if self._section is not None:
+            self._seen.add(self._section)
+            events.append(self._event({'type': 'section_end', 'section': self._section}))
+        self._in_fence = False
+        self._section = None
+
+    def feed(self, text):
+        if self._closed:
+            raise ValueError('feed() called after close()')
+
+        self._buffer += text
+        events = []
+
+        while self._buffer:
+            if not self._in_fence:
+                start = self._buffer.find(FENCE)
+                if start == -1:
+                    keep = _held_back(self._buffer, FENCE)
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                newline = self._buffer.find('\n', start + len(FENCE))
+                if newline == -1:
+                    self._buffer = self._buffer[start:]
+                    break
+                self._open_fence(self._buffer[start + len(FENCE):newline])
+                self._buffer = self._buffer[newline + 1:]
+                continue
+
+            if self._at_line_start and self._buffer.startswith(FENCE):
+                self._buffer = self._buffer[len(FENCE):]
+                self._close_fence(events)
+                continue
+
+            end = self._buffer.find(CLOSING_FENCE)
+            if end != -1:
+                self._emit_text(events, self._buffer[:end])
+                self._buffer = self._buffer[end + len(CLOSING_FENCE):]
+                self._close_fence(events)
+                continue
+
+            if self._at_line_start and FENCE.startswith(self._buffer):
+                break
+            keep = _held_back(self._buffer, CLOSING_FENCE)
+            self._emit_text(events, self._buffer[:len(self._buffer) - keep])
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            break
+
+        return events
+
+    def close(self):
+        # Flush whatever an unterminated block still holds, then finish
+        events = []
+        if self._in_fence:
+            self._emit_text(events, self._buffer)
+            self._close_fence(events)
+        self._buffer = ''
+        self._closed = True
+        events.append(self._event({'type': 'done'}))
+        return events
+
+    def fail(self, message):
+        self._closed = True
+        return [self._event({'type': 'error', 'error': message})]
@@ -0,0 +1,290 @@
+import queue
+import re
+import threading
+import traceback
+from generation import build_generate_prompt, build_section_prompt, build_spec_prompt
+from section_parser import SECTIONS, SectionStreamParser
+from streaming import collect_sections, finish_sections, section_events, section_events_async
+
+SPEC_BLOCK = re.compile(r'```(?:json)?[ \t]*\n(.*?)```', re.S)
+
+HTML_ID = re.compile(r'''\bid\s*=\s*["']([^"']+)["']''')
+HTML_CLASS = re.compile(r'''\bclass\s*=\s*["']([^"']*)["']''')
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+CSS_ATTRIBUTE = re.compile(r'\[[^\]]*\]')
+SELECTOR_NAME = re.compile(r'([.#])(-?[_a-zA-Z][\w-]*)')
+JS_BY_ID = re.compile(r'''getElementById\(\s*["']([^"']+)["']''')
+JS_SELECTOR = re.compile(r'''querySelector(?:All)?\(\s*["']([^"']+)["']''')
+JS_BY_CLASS = re.compile(r'''getElementsByClassName\(\s*["']([^"']+)["']''')
+JS_CLASS_LIST = re.compile(r'classList\.(?:add|toggle|replace)\(([^)]*)\)')
+JS_STRING = re.compile(r'''["']([\w\s-]+)["']''')
+
+
+def spec_text(text):
+    # The JSON plan, without the fence the model was asked to put it in
+    match = SPEC_BLOCK.search(text)
+    return (match.group(1) if match else text).strip() or '{}'
+
+
+def open_sections(data, generation_texts):
+    """Plan the site with one short call, then start a call per section.
+
+    Returns ``{section: texts}``; the section streams are all open (and,
+    through single-flight or the merge below, running) at once.
+    """
+    spec = spec_text(''.join(generation_texts(build_spec_prompt(data))))
+    return {section: generation_texts(build_section_prompt(data, spec, section)) for section in SECTIONS}
+
+
+async def open_sections_async(data, generation_texts):
+    import asyncio
+
+    spec = spec_text(''.join([text async for text in await generation_texts(build_spec_prompt(data))]))
+    texts = await asyncio.gather(*(
+        generation_texts(build_section_prompt(data, spec, section)) for section in SECTIONS))
+    return dict(zip(SECTIONS, texts))
+
+
+def _selector_names(selectors):
+    ids, classes = set(), set()
+    for kind, name in SELECTOR_NAME.findall(CSS_ATTRIBUTE.sub('', selectors)):
+        (ids if kind == '#' else classes).add(name)
+    return ids, classes
+
+
+def check_names(site):
+    """Ids and classes the CSS or JavaScript use that nothing defines.
+
+    The sections were written without seeing each other, so a renamed class
+    only shows up here. Ids and classes count as defined when they appear
+    in the HTML or in markup the JavaScript writes; classes the JavaScript
+    adds itself (``classList.add`` and friends) count as defined as well.
+    """
+    html, css, js = site.get('html', ''), site.get('css', ''), site.get('js', '')
+
+    defined_ids = set(HTML_ID.findall(html)) | set(HTML_ID.findall(js))
+    defined_classes = {name for names in HTML_CLASS.findall(html) + HTML_CLASS.findall(js) for name in names.split()}
+    for arguments in JS_CLASS_LIST.findall(js):
+        defined_classes.update(name for names in JS_STRING.findall(arguments) for name in names.split())
+
+    used_ids, used_classes = set(JS_BY_ID.findall(js)), set()
+    for names in JS_BY_CLASS.findall(js):
+        used_classes.update(names.split())
+    for selector in JS_SELECTOR.findall(js):
+        ids, classes = _selector_names(selector)
+        used_ids |= ids
+        used_classes |= classes
+
+    # Selectors are whatever precedes each '{'; at-rule preludes have no names
+    for prelude in CSS_COMMENT.sub('', css).split('{')[:-1]:
+        prelude = re.split(r'[;}]', prelude)[-1].strip()
+        if not prelude.startswith('@'):
+            ids, classes = _selector_names(prelude)
+            used_ids |= ids
+            used_classes |= classes
+
+    report = {}
+    if used_ids - defined_ids:
+        report['missingIds'] = sorted(used_ids - defined_ids)
+    if used_classes - defined_classes:
+        report['missingClasses'] = sorted(used_classes - defined_classes)
+    return report
+
+
+def checked(on_complete):
+    # Runs the name check before the done event goes out and reports it there
+    def check(site):
+        fields = dict(on_complete(site) or {}) if on_complete is not None else {}
+        report = check_names(site)
+        if report:
+            print(f"Sectioned generation has unmatched names: {report}")
+            fields['consistency'] = report
+        return fields
+
+    return check
+
+
+class SectionedParser:
+    """Section events for several single-section streams fed side by side.
+
+    Each stream gets its own ``SectionStreamParser`` and only the block for
+    its own section is kept. Events are renumbered into one ``seq``
+    sequence, so clients see an ordinary generation whose sections happen
+    to interleave.
+    """
+
+    def __init__(self):
+        self._parsers = {section: SectionStreamParser() for section in SECTIONS}
+        self._seq = 0
+
+    def _number(self, events, section=None):
+        numbered = []
+        for event in events:
+            if section is not None and event.get('section') != section:
+                continue
+            self._seq += 1
+            event['seq'] = self._seq
+            numbered.append(event)
+        return numbered
+
+    def feed(self, section, text):
+        return self._number(self._parsers[section].feed(text), section)
+
+    def end(self, section):
+        # Flushes an unterminated block; the section parser's own done is dropped
+        return self._number(self._parsers[section].close(), section)
+
+    def close(self):
+        return self._number([{'type': 'done'}])
+
+    def fail(self, message):
+        return self._number([{'type': 'error', 'error': message}])
+
+
+def merge_streams(streams):
+    """Interleave ``{section: texts}`` as ``(section, text)`` in arrival order.
+
+    Each stream is pulled by its own thread, which is what runs the upstream
+    calls concurrently. ``(section, None)`` marks the end of a section's
+    stream; the first error from any stream is raised here.
+    """
+    items = queue.Queue(maxsize=64)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def pump(section, texts):
+        try:
+            for text in texts:
+                if not put((section, text, None)):
+                    texts.close()
+                    return
+        except Exception as e:
+            put((section, None, e))
+            return
+        put((section, None, None))
+
+    for section, texts in streams.items():
+        threading.Thread(target=pump, args=(section, texts), daemon=True).start()
+
+    remaining = len(streams)
+    try:
+        while remaining:
+            section, text, error = items.get()
+            if error is not None:
+                raise error
+            if text is None:
+                remaining -= 1
+            yield section, text
+    finally:
+        stopped.set()
+
+
+async def merge_streams_async(streams):
+    import asyncio
+
+    items = asyncio.Queue(maxsize=64)
+
+    async def pump(section, texts):
+        try:
+            async for text in texts:
+                await items.put((section, text, None))
+        except Exception as e:
+            await items.put((section, None, e))
+            return
+        await items.put((section, None, None))
+
+    tasks = [asyncio.create_task(pump(section, texts)) for section, texts in streams.items()]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            section, text, error = await items.get()
+            if error is not None:
+                raise error
+            if text is None:
+                remaining -= 1
+            yield section, text
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _parse_merged(parser, sections, section, text, timer):
+    if text is None:
+        return collect_sections(sections, parser.end(section), timer)
+    if timer is not None:
+        timer.chunk(text)
+    return collect_sections(sections, parser.feed(section, text), timer)
+
+
+def sectioned_events(streams, on_complete=None, timer=None):
+    # section_events for concurrent per-section streams
+    parser = SectionedParser()
+    sections = {}
+    outcome, error = 'ok', None
+    try:
+        for section, text in merge_streams(streams):
+            for event in _parse_merged(parser, sections, section, text, timer):
+                yield event
+        for event in finish_sections(parser, sections, checked(on_complete), timer):
+            yield event
+    except GeneratorExit:
+        outcome = 'disconnected'
+        raise
+    except Exception as e:
+        print(f"Error in sectioned_events: {str(e)}")
+        traceback.print_exc()
+        outcome, error = 'error', e
+        for event in parser.fail(str(e)):
+            yield event
+    finally:
+        if timer is not None:
+            timer.finish(outcome, error)
+
+
+async def sectioned_events_async(streams, on_complete=None, timer=None):
+    parser = SectionedParser()
+    sections = {}
+    outcome, error = 'ok', None
+    try:
+        async for section, text in merge_streams_async(streams):
+            for event in _parse_merged(parser, sections, section, text, timer):
+                yield event
+        for event in finish_sections(parser, sections, checked(on_complete), timer):
+            yield event
+    except Exception as e:
+        print(f"Error in sectioned_events_async: {str(e)}")
+        traceback.print_exc()
+        outcome, error = 'error', e
+        for event in parser.fail(str(e)):
+            yield event
+    except BaseException:
+        # GeneratorExit or CancelledError: the client went away
+        outcome = 'disconnected'
+        raise
+    finally:
+        if timer is not None:
+            timer.finish(outcome, error)
+
+
+def generate_events(data, generation_texts, on_complete=None, timer=None):
+    # generation_texts(prompt) opens the (cached/coalesced) model stream.
+    # mode=sectioned plans the site first and then writes HTML, CSS and JS
+    # concurrently, so the wait is the slowest section rather than all three.
+    if data and data.get('mode') == 'sectioned':
+        return sectioned_events(open_sections(data, generation_texts), on_complete, timer)
+    return section_events(generation_texts(build_generate_prompt(data)), on_complete, timer)
+
+
+async def generate_events_async(data, generation_texts, on_complete=None, timer=None):
+    if data and data.get('mode') == 'sectioned':
+        return sectioned_events_async(await open_sections_async(data, generation_texts), on_complete, timer)
+    return section_events_async(await generation_texts(build_generate_prompt(data)), on_complete, timer)
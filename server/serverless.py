@@ -0,0 +1,137 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import os
+import traceback
+from backends import open_backend
+from generation import InvalidRequest, generate_description
+from metrics import RequestTimer
+from patches import modify_texts
+from projects import RevisionConflict, UnknownProject, open_project_store, project_saver, resolve_modify_request
+from response_cache import ResponseCache, cache_key, replay
+from sectioned import generate_events
+from similar_prompts import SimilarPrompts, reuse_similar
+from sse_output import OutputOptions, encode_stream
+from streaming import section_events
+
+# Everything here runs on every cold start, so keep it to cheap imports and
+# defer the rest (the model SDK, sqlite, asyncio) until something needs it.
+# Vercel injects the project's environment itself; only local runs read .env.
+if not os.getenv('VERCEL'):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+backend = None
+
+
+def get_backend():
+    # Built on the first request that needs the model and then kept for the
+    # life of the warm instance, along with its pooled upstream connection
+    global backend
+    if backend is None:
+        backend = open_backend()
+    return backend
+
+# Lives as long as the warm function instance; RESPONSE_CACHE_DIR=/tmp/...
+# extends it across instances sharing a filesystem
+response_cache = ResponseCache.from_env()
+# Same here: set PROJECT_STORE to a shared backend, otherwise clients see
+# unknown projects on cold instances and fall back to uploading the code
+projects = open_project_store()
+output_options = OutputOptions.from_env()
+# Point SIMILAR_PROMPTS_PATH at shared storage to reuse sites across instances
+similar = SimilarPrompts.from_env()
+
+
+def generation_texts(prompt, timer):
+    backend = get_backend()
+    key = cache_key(prompt, backend.model_name, backend.settings)
+    cached = response_cache.get(key)
+    if cached is not None:
+        timer.prompt(prompt, source='cache')
+        return replay(cached)
+    timer.prompt(prompt)
+
+    return response_cache.record(key, backend.stream(prompt))
+
+
+# Functions have no /metrics to scrape; set METRICS_LOG=- to get the
+# per-request timings as JSON lines in the function logs
+def generate_website_events(data, headers, timer):
+    open_texts = lambda prompt: generation_texts(prompt, timer)
+    reuse, on_complete = reuse_similar(similar, projects, generate_description(data))
+    if reuse is not None:
+        return reuse.events(open_texts, on_complete, timer)
+    return generate_events(data, open_texts, on_complete, timer)
+
+
+def modify_website_events(data, headers, timer):
+    data, project_id, base_revision = resolve_modify_request(projects, data, headers.get('If-Match'))
+    texts = modify_texts(data, lambda prompt: generation_texts(prompt, timer))
+    return section_events(texts, project_saver(projects, data, project_id, base_revision), timer)
+
+
+class SectionStreamHandler(BaseHTTPRequestHandler):
+    """Vercel handler streaming the same SSE events as server/app.py.
+
+    Subclasses set ``open_events`` to ``generate_website_events`` or
+    ``modify_website_events`` and ``route`` to its label in the timings.
+    """
+
+    open_events = None
+    route = None
+
+    def send_cors_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+
+    def send_json(self, status_code, payload, headers=None):
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_cors_headers()
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
+
+    def do_POST(self):
+        timer = RequestTimer(self.route)
+        try:
+            content_length = int(self.headers['Content-Length'])
+            request_body = self.rfile.read(content_length)
+            events = self.open_events(json.loads(request_body), self.headers, timer)
+        except InvalidRequest as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except UnknownProject:
+            self.send_json(404, {'error': 'Unknown project'})
+            return
+        except RevisionConflict as e:
+            self.send_json(409, {'error': 'Project has changed since baseRevision', 'revision': e.head}, {'ETag': f'"{e.head}"'})
+            return
+        except Exception as e:
+            timer.finish('error', e)
+            self.send_json(500, {
+                'error': str(e),
+                'traceback': traceback.format_exc()
+            })
+            return
+
+        # HTTP/1.0 response without a length: the body ends when we close
+        encoding = output_options.negotiate(self.headers.get('Accept-Encoding'))
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        for name, value in output_options.headers(encoding).items():
+            self.send_header(name, value)
+        self.send_cors_headers()
+        self.end_headers()
+
+        for data in encode_stream(events, output_options, encoding):
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_cors_headers()
+        self.end_headers()
@@ -0,0 +1,321 @@
+import functools
+import hashlib
+import heapq
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from metrics import similar_lookup_seconds, similar_lookups_total
+from patches import fenced, modify_texts, modify_texts_async
+from projects import UnknownProject, project_saver
+from section_parser import SECTIONS
+from streaming import section_events, section_events_async
+
+TOKEN = re.compile(r'[a-z0-9]+')
+# Words nearly every description has; they only make unrelated prompts look alike
+STOPWORDS = frozenset('a an and the for of with to in on at by my our your is are be that this website site web'.split())
+MERSENNE = (1 << 61) - 1
+# Candidates checked per lookup, so a crowded bucket can't blow the latency
+MAX_CANDIDATES = 256
+# Share of descriptions exactly at the threshold the LSH bands must find
+MIN_RECALL = 0.99
+
+ADAPT_INSTRUCTION = (
+    "Adapt this website so it fits this description instead: {description}. "
+    "Keep the layout, styling and animations that still fit; change the content, names and colors that don't."
+)
+
+
+def description_tokens(description):
+    return sorted({token for token in TOKEN.findall(description.lower()) if token not in STOPWORDS})
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+
+
+class MinHasher:
+    # Seeded universal hashes (a*x + b mod 2^61-1), so signatures are stable
+    # across processes and can be rebuilt from a persisted description. The
+    # per-word hash rows are the expensive part and descriptions share most
+    # of their words, so rows are cached.
+
+    def __init__(self, num_perm=64, seed=1, cache_words=65536):
+        self.num_perm = num_perm
+        self.permutations = [
+            (_hash64(f"{seed}:{i}:a") % (MERSENNE - 1) + 1, _hash64(f"{seed}:{i}:b") % MERSENNE)
+            for i in range(num_perm)
+        ]
+        self._row = functools.lru_cache(maxsize=cache_words)(self._hash_row)
+
+    def _hash_row(self, token):
+        h = _hash64(token)
+        return tuple((a * h + b) % MERSENNE for a, b in self.permutations)
+
+    def signature(self, tokens):
+        if not tokens:
+            return None
+        return list(map(min, zip(*(self._row(token) for token in tokens))))
+
+
+def candidate_probability(similarity, bands, rows):
+    # Chance that two descriptions this similar share at least one band
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def lsh_shape(num_perm, threshold):
+    # The (bands, rows) split that makes a description exactly at the
+    # threshold a candidate at least MIN_RECALL of the time, with the fewest
+    # extra candidates; the exact Jaccard check then drops the false positives.
+    # A split whose S-curve sits at the threshold itself misses ~1 in 5 there.
+    shapes = [(bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    recalled = [shape for shape in shapes if candidate_probability(threshold, *shape) >= MIN_RECALL]
+    return min(recalled, key=lambda shape: shape[0]) if recalled else shapes[-1]
+
+
+class SimilarPrompts:
+    """Generated sites indexed by description, for reusing near-duplicates.
+
+    Descriptions are reduced to word sets and MinHash signatures; an LSH
+    banding index finds candidates and the exact Jaccard similarity of the
+    word sets decides whether one is within ``threshold``. Entries point at
+    a saved project revision. With a ``path`` they are appended there as
+    JSON lines and the index is rebuilt from it on start.
+
+    At most ``max_entries`` are kept, dropping the least recently added or
+    reused first, so the index can match a bounded project store; the file
+    is rewritten with just those once it has twice as many lines.
+
+    ``mode`` says what a match is used for: ``serve`` streams the stored
+    site straight back, ``modify`` sends it through a (patch-mode) modify
+    asking the model to adapt it to the new description.
+    """
+
+    def __init__(self, mode='serve', threshold=0.8, num_perm=64, path=None, max_entries=1000):
+        self.mode = mode
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_shape(num_perm, threshold)
+        self.path = path
+        self.max_entries = max_entries
+        self._buckets = [{} for _ in range(self.bands)]
+        # entry id -> (description, tokens, project_id, revision), least
+        # recently used first; ids only grow, so a larger one is newer
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lines = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    @classmethod
+    def from_env(cls):
+        # SIMILAR_PROMPTS=serve|modify turns the index on
+        mode = os.getenv('SIMILAR_PROMPTS')
+        if not mode:
+            return None
+        if mode not in ('serve', 'modify'):
+            raise ValueError(f"Unknown SIMILAR_PROMPTS: {mode}")
+        return cls(
+            mode=mode,
+            threshold=float(os.getenv('SIMILAR_PROMPTS_THRESHOLD', '0.8')),
+            path=os.getenv('SIMILAR_PROMPTS_PATH') or None,
+            # Entries whose project the store has dropped can't be reused
+            max_entries=int(os.getenv('SIMILAR_PROMPTS_MAX') or os.getenv('PROJECT_STORE_MAX', '1000')),
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _band_keys(self, tokens):
+        rows = self.rows
+        signature = self.hasher.signature(tokens)
+        return [hash(tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def _insert(self, description, project_id, revision):
+        tokens = frozenset(description_tokens(description))
+        if not tokens:
+            return False
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (description, tokens, project_id, revision)
+        for bucket, key in zip(self._buckets, self._band_keys(tokens)):
+            bucket.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > max(self.max_entries, 1):
+            self._remove(next(iter(self._entries)))
+        return True
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for bucket, key in zip(self._buckets, self._band_keys(entry[1])):
+            ids = bucket[key]
+            ids.discard(entry_id)
+            if not ids:
+                del bucket[key]
+
+    def _load(self, path):
+        with open(path) as f:
+            for line in f:
+                self._lines += 1
+                try:
+                    record = json.loads(line)
+                    self._insert(record['description'], record['projectId'], record['revision'])
+                except (ValueError, KeyError):
+                    continue
+
+    def _record(self, entry):
+        description, _, project_id, revision = entry
+        return json.dumps({'description': description, 'projectId': project_id, 'revision': revision}) + '\n'
+
+    def _compact(self):
+        # Caller holds the lock; written aside and swapped in, so a crash
+        # leaves either the old file or the new one
+        partial = f"{self.path}.tmp"
+        with open(partial, 'w') as f:
+            f.writelines(self._record(entry) for entry in self._entries.values())
+        os.replace(partial, self.path)
+        self._lines = len(self._entries)
+
+    def add(self, description, project_id, revision):
+        with self._lock:
+            if self._insert(description, project_id, revision) and self.path:
+                with open(self.path, 'a') as f:
+                    f.write(self._record(next(reversed(self._entries.values()))))
+                self._lines += 1
+                if self._lines > 2 * max(self.max_entries, 1):
+                    self._compact()
+
+    def matches(self, description):
+        """``(entry_id, (description, tokens, project_id, revision),
+        similarity)`` for each stored description within the threshold,
+        closest first."""
+        started = time.perf_counter()
+        tokens = frozenset(description_tokens(description))
+        found = []
+        if tokens:
+            keys = self._band_keys(tokens)
+            with self._lock:
+                shared = Counter()
+                for bucket, key in zip(self._buckets, keys):
+                    shared.update(bucket.get(key, ()))
+                # The more bands a candidate shares the closer it is likely to
+                # be, so those are checked first when there are too many
+                for entry_id, _ in heapq.nlargest(MAX_CANDIDATES, shared.items(), key=lambda item: (item[1], item[0])):
+                    entry = self._entries[entry_id]
+                    similarity = len(tokens & entry[1]) / len(tokens | entry[1])
+                    if similarity >= self.threshold:
+                        found.append((entry_id, entry, similarity))
+            found.sort(key=lambda match: match[2], reverse=True)
+
+        similar_lookup_seconds.observe(time.perf_counter() - started)
+        similar_lookups_total.inc('hit' if found else 'miss')
+        return found
+
+    def lookup(self, description):
+        """``((description, tokens, project_id, revision), similarity)`` of
+        the closest stored description within the threshold, or None."""
+        found = self.matches(description)
+        return found[0][1:] if found else None
+
+    def find(self, description, store):
+        for entry_id, (match, _, project_id, revision), similarity in self.matches(description):
+            try:
+                site = store.get(project_id, revision)
+            except UnknownProject:
+                # Dropped from the store since; so is its entry here
+                with self._lock:
+                    self._remove(entry_id)
+                continue
+            if not site.get('html') or not site.get('css'):
+                continue
+            with self._lock:
+                if entry_id in self._entries:
+                    self._entries.move_to_end(entry_id)
+            return Reuse(self.mode, description, match, similarity, site)
+        return None
+
+    def saver(self, description, on_complete, reuse=None):
+        # Wraps a project_saver hook: index the saved site under this
+        # description and say in the done event when it came from a match
+        def save(sections):
+            fields = dict(on_complete(sections))
+            if reuse is None or not reuse.instant:
+                self.add(description, fields['projectId'], fields['revision'])
+            if reuse is not None:
+                fields['similarTo'] = {'description': reuse.match, 'similarity': round(reuse.similarity, 3)}
+            return fields
+
+        return save
+
+
+def site_texts(site):
+    # A stored site in the fenced format a generation streams
+    for section in SECTIONS:
+        if site.get(section):
+            yield fenced(section, site[section])
+
+
+async def site_texts_async(site):
+    for text in site_texts(site):
+        yield text
+
+
+class Reuse:
+    def __init__(self, mode, description, match, similarity, site):
+        self.mode = mode
+        self.description = description
+        self.match = match
+        self.similarity = similarity
+        self.site = site
+
+    @property
+    def instant(self):
+        # Served without a model call, so it needn't wait for a slot. The
+        # same words in a different order need no adapting either.
+        return self.mode == 'serve' or self.similarity >= 1.0
+
+    def modify_request(self):
+        return {
+            'modificationDescription': ADAPT_INSTRUCTION.format(description=self.description),
+            'currentHtml': self.site['html'],
+            'currentCss': self.site['css'],
+            'currentJs': self.site.get('js') or '',
+            'mode': 'patch',
+        }
+
+    def events(self, generation_texts, on_complete=None, timer=None):
+        if self.instant:
+            if timer is not None:
+                timer.prompt(self.description, source='similar')
+            return section_events(site_texts(self.site), on_complete, timer)
+        # The client builds the site from these events alone, so the
+        # sections the patch left alone are streamed too
+        texts = modify_texts(self.modify_request(), generation_texts, complete=True)
+        return section_events(texts, on_complete, timer)
+
+    async def events_async(self, generation_texts, on_complete=None, timer=None):
+        if self.instant:
+            if timer is not None:
+                timer.prompt(self.description, source='similar')
+            return section_events_async(site_texts_async(self.site), on_complete, timer)
+        texts = await modify_texts_async(self.modify_request(), generation_texts, complete=True)
+        return section_events_async(texts, on_complete, timer)
+
+
+def reuse_similar(similar, store, description):
+    """``(reuse, on_complete)`` for a generate request.
+
+    ``reuse`` is the near-duplicate to start from, or None to generate as
+    usual. ``on_complete`` saves the result as a new project in ``store``
+    and indexes it; a reused site is its base, so sections a patch didn't
+    touch are saved as they were rather than empty.
+    """
+    if similar is None:
+        return None, project_saver(store)
+    reuse = similar.find(description, store)
+    base = reuse.modify_request() if reuse is not None else None
+    return reuse, similar.saver(description, project_saver(store, base), reuse)
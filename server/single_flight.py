@@ -0,0 +1,165 @@
+import asyncio
+import threading
+
+
+class Flight:
+    """One upstream generation shared by every request for the same key.
+
+    Chunks are buffered for the life of the flight, so a subscriber that
+    joins late first replays what it missed and then follows live output.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def publish(self, text):
+        with self._cond:
+            self.chunks.append(text)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.finished = True
+            self.error = error
+            self._cond.notify_all()
+
+    def subscribe(self):
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.finished:
+                    self._cond.wait()
+                pending = self.chunks[index:]
+                index = len(self.chunks)
+                finished, error = self.finished, self.error
+            yield from pending
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Coalesce identical in-flight generations onto one upstream stream.
+
+    The first request for a key (the leader) opens the upstream stream with
+    ``start()``; a background thread pumps it into the flight so it keeps
+    going even if the leader's client goes away. Requests arriving while the
+    flight is open attach as followers. Errors raised by ``start()`` itself
+    propagate to the leader. Errors from the stream, including an upstream
+    refusal with a backend that opens lazily (Gemini), reach the leader and
+    every follower when they read up to them.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _finish(self, key, flight, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(error)
+
+    def _pump(self, key, flight, texts):
+        error = None
+        try:
+            for text in texts:
+                flight.publish(text)
+        except Exception as e:
+            error = e
+        finally:
+            self._finish(key, flight, error)
+
+    def stream(self, key, start):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+
+        if leader:
+            try:
+                texts = start()
+            except Exception as e:
+                self._finish(key, flight, e)
+                raise
+            threading.Thread(target=self._pump, args=(key, flight, texts), daemon=True).start()
+
+        return flight.subscribe()
+
+
+class AsyncFlight:
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self._cond = asyncio.Condition()
+
+    async def publish(self, text):
+        async with self._cond:
+            self.chunks.append(text)
+            self._cond.notify_all()
+
+    async def finish(self, error=None):
+        async with self._cond:
+            self.finished = True
+            self.error = error
+            self._cond.notify_all()
+
+    async def subscribe(self):
+        index = 0
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: index < len(self.chunks) or self.finished)
+                pending = self.chunks[index:]
+                index = len(self.chunks)
+                finished, error = self.finished, self.error
+            for text in pending:
+                yield text
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class AsyncSingleFlight:
+    """Event-loop version of ``SingleFlight``; ``start`` is a coroutine
+    function returning an async iterator of text chunks."""
+
+    def __init__(self):
+        self._flights = {}
+        self._tasks = set()
+
+    async def _finish(self, key, flight, error=None):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        await flight.finish(error)
+
+    async def _pump(self, key, flight, texts):
+        error = None
+        try:
+            async for text in texts:
+                await flight.publish(text)
+        except Exception as e:
+            error = e
+        finally:
+            await self._finish(key, flight, error)
+
+    async def stream(self, key, start):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = AsyncFlight()
+            try:
+                texts = await start()
+            except Exception as e:
+                await self._finish(key, flight, e)
+                raise
+            task = asyncio.create_task(self._pump(key, flight, texts))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        return flight.subscribe()
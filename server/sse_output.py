@@ -0,0 +1,285 @@
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from metrics import write_seconds
+
+HEARTBEAT = ': keep-alive\n\n'
+
+# zlib wbits selecting the container for each Content-Encoding
+ENCODING_WBITS = {
+    'gzip': 31,
+    'deflate': 15,
+}
+
+
+def sse_event(event):
+    # The id is what a reconnecting client sends back as Last-Event-ID; a
+    # coalesced delta carries the seq of the last delta merged into it
+    if 'seq' in event:
+        return f"id: {event['seq']}\ndata: {json.dumps(event)}\n\n"
+    return f"data: {json.dumps(event)}\n\n"
+
+
+class OutputOptions:
+    """How section events are written to the wire.
+
+    Consecutive deltas for the same section are merged and written together
+    once ``coalesce_bytes`` of text is pending or the oldest pending delta
+    is ``flush_interval`` seconds old; section ends, done and errors flush
+    straight away. ``heartbeat_interval`` sends an SSE comment after that
+    many idle seconds so proxies don't buffer or time out the stream.
+    ``compression`` is ``gzip``, ``deflate`` or ``none``, applied only when
+    the client's Accept-Encoding allows it, with a sync flush per write so
+    the browser can decompress as data arrives. Zero disables a limit, so
+    with both coalescing limits at zero deltas are held until their section
+    ends; ``coalesce_bytes=1`` writes every delta as it comes.
+    """
+
+    def __init__(self, coalesce_bytes=16384, flush_interval=0.05, heartbeat_interval=15.0, compression='gzip'):
+        self.coalesce_bytes = coalesce_bytes
+        self.flush_interval = flush_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.compression = compression
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            coalesce_bytes=int(os.getenv('SSE_COALESCE_BYTES', '16384')),
+            flush_interval=float(os.getenv('SSE_FLUSH_MS', '50')) / 1000,
+            heartbeat_interval=float(os.getenv('SSE_HEARTBEAT_S', '15')),
+            compression=os.getenv('SSE_COMPRESSION', 'gzip'),
+        )
+
+    def negotiate(self, accept_encoding):
+        accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+        return self.compression if self.compression in accepted else None
+
+    def headers(self, encoding):
+        headers = {
+            'Cache-Control': 'no-cache',
+            # nginx and friends would otherwise buffer the whole stream
+            'X-Accel-Buffering': 'no',
+        }
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            headers['Vary'] = 'Accept-Encoding'
+        return headers
+
+
+class SseEncoder:
+    # Coalescing, heartbeat and compression state for one stream; the sync
+    # and async drivers below only decide when to call it
+
+    def __init__(self, options, encoding=None):
+        self.options = options
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_pending_at = None
+        self.last_write_at = time.monotonic()
+        self._compressor = zlib.compressobj(wbits=ENCODING_WBITS[encoding]) if encoding else None
+
+    @property
+    def needs_timer(self):
+        return bool(self.options.flush_interval or self.options.heartbeat_interval)
+
+    def _write(self, text, now):
+        self.last_write_at = now
+        data = text.encode()
+        if self._compressor is None:
+            return data
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self, now):
+        if not self.pending:
+            return b''
+        text = ''.join(sse_event(event) for event in self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        self.first_pending_at = None
+        return self._write(text, now)
+
+    def _due(self, now):
+        # A zero limit never fires; with both at zero deltas wait for the section end
+        options = self.options
+        return bool((options.coalesce_bytes and self.pending_bytes >= options.coalesce_bytes)
+                    or (options.flush_interval and now - self.first_pending_at >= options.flush_interval))
+
+    def push(self, event, now):
+        if event['type'] != 'delta':
+            self.pending.append(event)
+            return self.flush(now)
+
+        last = self.pending[-1] if self.pending else None
+        if last is not None and last['type'] == 'delta' and last['section'] == event['section']:
+            last['text'] += event['text']
+            last['seq'] = event['seq']
+        else:
+            self.pending.append(dict(event))
+        self.pending_bytes += len(event['text'])
+        if self.first_pending_at is None:
+            self.first_pending_at = now
+
+        if self._due(now):
+            return self.flush(now)
+        return b''
+
+    def timeout(self, now):
+        # Seconds until tick() has something to do, or None to wait forever
+        deadlines = []
+        if self.pending and self.options.flush_interval:
+            deadlines.append(self.first_pending_at + self.options.flush_interval)
+        if self.options.heartbeat_interval:
+            deadlines.append(self.last_write_at + self.options.heartbeat_interval)
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
+    def tick(self, now):
+        interval = self.options.flush_interval
+        if self.pending and interval and now - self.first_pending_at >= interval:
+            return self.flush(now)
+        if self.options.heartbeat_interval and now - self.last_write_at >= self.options.heartbeat_interval:
+            return self._write(HEARTBEAT, now)
+        return b''
+
+    def finish(self, now):
+        data = self.flush(now)
+        if self._compressor is not None:
+            data += self._compressor.flush(zlib.Z_FINISH)
+        return data
+
+
+_END = object()
+
+
+def _timed_writes(chunks):
+    # The time spent suspended in yield is the server writing the chunk out,
+    # which blocks while the client isn't reading
+    waited = 0.0
+    try:
+        for data in chunks:
+            started = time.perf_counter()
+            yield data
+            waited += time.perf_counter() - started
+    finally:
+        chunks.close()
+        write_seconds.observe(waited)
+
+
+def encode_stream(events, options, encoding=None):
+    """Write an iterator of section events as (coalesced, compressed) SSE.
+
+    Flush deadlines and heartbeats have to fire while the model is silent,
+    so a helper thread pulls events into a small bounded queue; when the
+    client falls behind the queue fills and the helper stops reading
+    ``events``. In app.py those are a resumable stream's follower, so the
+    generation itself carries on into the replay buffer; the serverless
+    handlers pass the generation, which is then held back with the client.
+    """
+    return _timed_writes(_encode_stream(events, options, encoding))
+
+
+def _encode_stream(events, options, encoding):
+    encoder = SseEncoder(options, encoding)
+    if not encoder.needs_timer:
+        for event in events:
+            data = encoder.push(event, time.monotonic())
+            if data:
+                yield data
+        data = encoder.finish(time.monotonic())
+        if data:
+            yield data
+        return
+
+    items = queue.Queue(maxsize=64)
+    stopped = threading.Event()
+
+    def put(item):
+        # Gives up once the client has gone, rather than blocking forever
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def pump():
+        try:
+            for event in events:
+                if not put(event):
+                    break
+        finally:
+            events.close()
+            put(_END)
+
+    threading.Thread(target=pump, daemon=True).start()
+    try:
+        while True:
+            try:
+                item = items.get(timeout=encoder.timeout(time.monotonic()))
+            except queue.Empty:
+                data = encoder.tick(time.monotonic())
+            else:
+                if item is _END:
+                    break
+                data = encoder.push(item, time.monotonic())
+            if data:
+                yield data
+        data = encoder.finish(time.monotonic())
+        if data:
+            yield data
+    finally:
+        stopped.set()
+
+
+async def _timed_writes_async(chunks):
+    waited = 0.0
+    try:
+        async for data in chunks:
+            started = time.perf_counter()
+            yield data
+            waited += time.perf_counter() - started
+    finally:
+        await chunks.aclose()
+        write_seconds.observe(waited)
+
+
+def encode_stream_async(events, options, encoding=None):
+    return _timed_writes_async(_encode_stream_async(events, options, encoding))
+
+
+async def _encode_stream_async(events, options, encoding):
+    # Imported here so the sync (serverless) path never loads asyncio
+    import asyncio
+
+    encoder = SseEncoder(options, encoding)
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(events.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=encoder.timeout(time.monotonic()))
+            if not done:
+                data = encoder.tick(time.monotonic())
+            else:
+                finished, pending = pending, None
+                try:
+                    event = finished.result()
+                except StopAsyncIteration:
+                    break
+                data = encoder.push(event, time.monotonic())
+            if data:
+                yield data
+        data = encoder.finish(time.monotonic())
+        if data:
+            yield data
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+        await events.aclose()
@@ -0,0 +1,89 @@
+import traceback
+from section_parser import SectionStreamParser
+
+
+def chunk_texts(response):
+    for chunk in response:
+        text = getattr(chunk, 'text', None)
+        if text:
+            yield text
+
+
+async def chunk_texts_async(response):
+    async for chunk in response:
+        text = getattr(chunk, 'text', None)
+        if text:
+            yield text
+
+
+def collect_sections(sections, events, timer=None):
+    for event in events:
+        if event['type'] == 'delta':
+            sections.setdefault(event['section'], []).append(event['text'])
+        elif event['type'] == 'section_end' and timer is not None:
+            timer.section_end(event['section'])
+    return events
+
+
+def finish_sections(parser, sections, on_complete, timer=None):
+    # on_complete(site) can add fields (e.g. the saved revision) to the done event
+    events = collect_sections(sections, parser.close(), timer)
+    if on_complete is not None:
+        events[-1].update(on_complete({
+            section: ''.join(parts) for section, parts in sections.items()
+        }))
+    return events
+
+
+def section_events(texts, on_complete=None, timer=None):
+    # Parse the fenced code blocks as they arrive so clients only append deltas
+    parser = SectionStreamParser()
+    sections = {}
+    outcome, error = 'ok', None
+    try:
+        for text in texts:
+            if timer is not None:
+                timer.chunk(text)
+            for event in collect_sections(sections, parser.feed(text), timer):
+                yield event
+        for event in finish_sections(parser, sections, on_complete, timer):
+            yield event
+    except GeneratorExit:
+        outcome = 'disconnected'
+        raise
+    except Exception as e:
+        print(f"Error in section_events: {str(e)}")
+        traceback.print_exc()
+        outcome, error = 'error', e
+        for event in parser.fail(str(e)):
+            yield event
+    finally:
+        if timer is not None:
+            timer.finish(outcome, error)
+
+
+async def section_events_async(texts, on_complete=None, timer=None):
+    parser = SectionStreamParser()
+    sections = {}
+    outcome, error = 'ok', None
+    try:
+        async for text in texts:
+            if timer is not None:
+                timer.chunk(text)
+            for event in collect_sections(sections, parser.feed(text), timer):
+                yield event
+        for event in finish_sections(parser, sections, on_complete, timer):
+            yield event
+    except Exception as e:
+        print(f"Error in section_events_async: {str(e)}")
+        traceback.print_exc()
+        outcome, error = 'error', e
+        for event in parser.fail(str(e)):
+            yield event
+    except BaseException:
+        # GeneratorExit or CancelledError: the client went away
+        outcome = 'disconnected'
+        raise
+    finally:
+        if timer is not None:
+            timer.finish(outcome, error)
@@ -0,0 +1,90 @@
+import io
+import zipfile
+
+import pytest
+
+from export import ExportOptions, export_files, minify_css, minify_js, prune_css, zip_stored
+
+
+@pytest.mark.parametrize('source, expected', [
+    # A regex after return, an operator or the ')' of a condition...
+    ('return /a  b/.test(s)', 'return /a  b/.test(s)'),
+    ('x = /[/]  y/g', 'x=/[/]  y/g'),
+    ('if (ok) /a  b/.test(s)', 'if(ok)/a  b/.test(s)'),
+    ('while (f(a)) /a  b/.exec(s)', 'while(f(a))/a  b/.exec(s)'),
+    # ...but a division after a value, so the '//' after it is a comment
+    ('var x = (a + b) / 2 // half', 'var x=(a + b)/ 2'),
+    ('y = a / b / 2', 'y=a / b / 2'),
+])
+def test_minify_js_tells_regexes_from_division(source, expected):
+    assert minify_js(source) == expected
+
+
+def test_minify_js_keeps_literals():
+    source = '''const url = "http://a.b/*c*/";  // comment
+let s = 'it\\'s // fine'
+const r = /\\/\\/+/g'''
+    assert minify_js(source) == '''const url="http://a.b/*c*/";let s='it\\'s // fine'
+const r=/\\/\\/+/g'''
+
+
+def test_minify_js_keeps_nested_template_literals():
+    source = 'const t = `a  ${ cond ? `b  ${ c + "}" }` : `d` }  e` // x\nf()'
+    assert minify_js(source) == 'const t=`a  ${ cond?`b  ${ c + "}" }`:`d` }  e`\nf()'
+
+
+@pytest.mark.parametrize('source, expected', [
+    # Line breaks that end a statement through ASI stay
+    ('return\n42', 'return\n42'),
+    ('a\n++b', 'a\n++b'),
+    ('let a = {}\nlet b = 1', 'let a={}\nlet b=1'),
+    ('x = 1 /* one\n */\ny()', 'x=1\ny()'),
+    # Ones that can't end a statement go
+    ('f(a,\n  b);\n  g();\n', 'f(a,b);g();'),
+    ('if (a) {\n  b()\n}\n', 'if(a){b()}'),
+])
+def test_minify_js_keeps_statement_ends(source, expected):
+    assert minify_js(source) == expected
+
+
+def test_minify_css_keeps_strings_and_significant_spaces():
+    source = '/* c */ .a :hover , .b > .c { content: "x  /* y */ ;}" ; margin : 0 calc(1px + 2px) ; }'
+    assert minify_css(source) == '.a :hover,.b>.c{content:"x  /* y */ ;}";margin :0 calc(1px + 2px)}'
+
+
+def test_prune_css_drops_only_rules_nothing_matches():
+    html = '<div class="card hero" id="top"><span class=bare></span></div>'
+    js = "el.classList.add(`item-${i}`)"
+    css = '''
+.card, .missing { a: b }
+.gone { a: b }
+#top:hover, .bare, .item-3 { a: b }
+.card:not(.ghost) { a: b }
+@media (max-width: 600px) { .gone { a: b } }
+@media print { .hero { a: b } }
+@keyframes spin { from { a: b } }
+.x::after { content: "} .gone {" }
+'''
+    pruned = prune_css(css, html, js)
+    assert '.card {' in pruned and '.missing' not in pruned
+    assert '#top:hover, .bare, .item-3' in pruned
+    assert '.card:not(.ghost)' in pruned
+    assert '.gone' not in pruned.replace('"} .gone {"', '')
+    assert '(max-width: 600px)' not in pruned and '@media print' in pruned
+    assert '@keyframes spin' in pruned
+
+
+@pytest.mark.parametrize('options, names', [
+    (ExportOptions(), ['index.html', 'styles.css', 'script.js']),
+    (ExportOptions(inline=True), ['index.html']),
+])
+def test_export_zip_is_readable(options, names):
+    sections = {'html': '<h1 class="t">Hi</h1>', 'css': '.t { color: red }', 'js': 'console.log("</script>")'}
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_stored(export_files(sections, options)))))
+    assert archive.testzip() is None
+    assert archive.namelist() == names
+    index = archive.read('index.html').decode()
+    if options.inline:
+        assert '<style>.t{color:red}</style>' in index and '<\\/script>' in index
+    else:
+        assert '<link rel="stylesheet" href="styles.css">' in index and '<script src="script.js"></script>' in index
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from backends import ModelBackend
+from hedging import HedgedBackend
+
+
+class SlowFirstBackend(ModelBackend):
+    # The first stream opened takes ``stall`` seconds to its first chunk,
+    # later ones answer straight away; records which streams were closed
+    model_name = 'test'
+
+    def __init__(self, stall):
+        self.stall = stall
+        self.opened = 0
+        self.closed = []
+
+    def _texts(self, attempt, delay):
+        try:
+            time.sleep(delay)
+            yield f'attempt {attempt}'
+        finally:
+            self.closed.append(attempt)
+
+    def stream(self, prompt):
+        self.opened += 1
+        return self._texts(self.opened, self.stall if self.opened == 1 else 0)
+
+    async def _texts_async(self, attempt, delay):
+        try:
+            await asyncio.sleep(delay)
+            yield f'attempt {attempt}'
+        finally:
+            self.closed.append(attempt)
+
+    async def stream_async(self, prompt):
+        self.opened += 1
+        return self._texts_async(self.opened, self.stall if self.opened == 1 else 0)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_fast_primary_is_not_hedged():
+    backend = SlowFirstBackend(stall=0)
+    hedged = HedgedBackend(backend, initial_delay=0.5)
+    assert list(hedged.stream('prompt')) == ['attempt 1']
+    assert backend.opened == 1
+
+
+def test_slow_primary_is_hedged_and_closed():
+    backend = SlowFirstBackend(stall=0.3)
+    hedged = HedgedBackend(backend, initial_delay=0.05)
+    assert list(hedged.stream('prompt')) == ['attempt 2']
+    assert backend.opened == 2
+    # The primary is closed once its first chunk turns up
+    wait_for(lambda: 1 in backend.closed)
+
+
+def test_opening_does_not_wait_for_the_first_chunk():
+    backend = SlowFirstBackend(stall=0.3)
+    hedged = HedgedBackend(backend, initial_delay=1.0)
+    started = time.monotonic()
+    streams = [hedged.stream('prompt') for _ in range(3)]
+    assert time.monotonic() - started < 0.1
+    assert [list(texts) for texts in streams] == [['attempt 1'], ['attempt 2'], ['attempt 3']]
+
+
+def test_async_slow_primary_is_hedged_and_closed():
+    async def run():
+        backend = SlowFirstBackend(stall=0.3)
+        hedged = HedgedBackend(backend, initial_delay=0.05)
+        texts = await hedged.stream_async('prompt')
+        received = [text async for text in texts]
+        await asyncio.sleep(0.4)
+        return backend, received
+
+    backend, received = asyncio.run(run())
+    assert received == ['attempt 2']
+    assert 1 in backend.closed
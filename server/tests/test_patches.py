@@ -0,0 +1,71 @@
+import pytest
+
+from patches import PatchError, apply_edits, apply_response, parse_edits, patched_texts
+
+SOURCE = '''<header>
+  <h1>Coffee</h1>
+</header>
+<p>Open daily</p>'''
+
+
+def test_exact_unique_match_is_replaced():
+    assert apply_edits(SOURCE, [('<h1>Coffee</h1>', '<h1>Tea</h1>')]) == SOURCE.replace('Coffee', 'Tea')
+
+
+def test_edits_apply_in_order():
+    edits = [('Coffee', 'Tea'), ('<h1>Tea</h1>', '<h1>Green tea</h1>')]
+    assert '<h1>Green tea</h1>' in apply_edits(SOURCE, edits)
+
+
+def test_indentation_insensitive_match_replaces_the_lines():
+    patched = apply_edits(SOURCE, [('<header>\n<h1>Coffee</h1>\n</header>', '<header><h1>Tea</h1></header>')])
+    assert patched == '<header><h1>Tea</h1></header>\n<p>Open daily</p>'
+
+
+def test_ambiguous_search_is_refused():
+    with pytest.raises(PatchError):
+        apply_edits('<p>a</p>\n<p>a</p>', [('<p>a</p>', '<p>b</p>')])
+
+
+def test_missing_search_is_refused():
+    with pytest.raises(PatchError):
+        apply_edits(SOURCE, [('<h2>Coffee</h2>', '<h2>Tea</h2>')])
+
+
+def test_empty_search_only_fills_an_empty_file():
+    assert apply_edits('', [('', 'body {}')]) == 'body {}'
+    with pytest.raises(PatchError):
+        apply_edits(SOURCE, [('', 'replaced')])
+
+
+RESPONSE = '''```html
+<<<<<<< SEARCH
+<h1>Coffee</h1>
+=======
+<h1>Tea</h1>
+>>>>>>> REPLACE
+```
+'''
+
+
+def test_response_patches_only_its_sections():
+    current = {'html': SOURCE, 'css': 'h1 { color: red; }', 'js': ''}
+    assert list(parse_edits(RESPONSE)) == ['html']
+    assert apply_response(current, RESPONSE) == {**current, 'html': SOURCE.replace('Coffee', 'Tea')}
+
+
+def test_response_without_edit_blocks_is_refused():
+    with pytest.raises(PatchError):
+        parse_edits('```html\n<h1>Tea</h1>\n```\n')
+
+
+def test_patched_texts_falls_back_when_an_edit_does_not_apply():
+    current = {'html': '<h1>Other</h1>', 'css': '', 'js': ''}
+    assert list(patched_texts(current, iter([RESPONSE]), lambda: iter(['full site']))) == ['full site']
+
+
+def test_patched_texts_streams_changed_or_all_sections():
+    current = {'html': SOURCE, 'css': 'h1 {}', 'js': 'x()'}
+    changed = list(patched_texts(current, iter([RESPONSE]), None))
+    assert len(changed) == 1 and changed[0].startswith('```html\n')
+    assert len(list(patched_texts(current, iter([RESPONSE]), None, complete=True))) == 3
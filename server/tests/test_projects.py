@@ -0,0 +1,33 @@
+import pytest
+
+from projects import DirectoryProjectStore, MemoryProjectStore, SqliteProjectStore, UnknownProject
+
+SITE = {'html': '<h1>Coffee</h1>', 'css': 'h1 {}', 'js': ''}
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'filesystem'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SqliteProjectStore(str(tmp_path / 'projects.db'))
+    if request.param == 'filesystem':
+        return DirectoryProjectStore(str(tmp_path / 'projects'))
+    return MemoryProjectStore()
+
+
+def test_revision_defaults_to_the_head(store):
+    project_id, first = store.create(SITE)
+    second = store.commit(project_id, first, {**SITE, 'js': 'go()'})
+    assert store.revision(project_id) == second
+    assert store.revision(project_id, first) == first
+
+
+@pytest.mark.parametrize('revision', ['f' * 16, '../../etc/passwd', 'F' * 16])
+def test_unknown_or_malformed_revision_is_unknown(store, revision):
+    project_id, _ = store.create(SITE)
+    with pytest.raises(UnknownProject):
+        store.revision(project_id, revision)
+
+
+def test_unknown_project_is_unknown(store):
+    with pytest.raises(UnknownProject):
+        store.revision('0' * 32, 'f' * 16)
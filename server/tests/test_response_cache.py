@@ -0,0 +1,44 @@
+import os
+import time
+
+from response_cache import ResponseCache
+
+
+def stored(directory):
+    return sorted(name[:-len('.json')] for name in os.listdir(directory) if name.endswith('.json'))
+
+
+def age(path, seconds):
+    os.utime(path, (time.time() - seconds, time.time() - seconds))
+
+
+def test_directory_keeps_the_most_recently_used_entries(tmp_path):
+    cache = ResponseCache(max_entries=2, directory=str(tmp_path))
+    cache.put('a', ['one'])
+    cache.put('b', ['two'])
+    age(tmp_path / 'a.json', 20)
+    age(tmp_path / 'b.json', 10)
+    # A fresh process reading 'a' from disk makes it the most recent
+    assert ResponseCache(max_entries=2, directory=str(tmp_path)).get('a') == ['one']
+    cache.put('c', ['three'])
+    assert stored(tmp_path) == ['a', 'c']
+
+
+def test_directory_is_held_to_the_byte_limit(tmp_path):
+    cache = ResponseCache(max_bytes=100, directory=str(tmp_path))
+    for key in 'abcde':
+        cache.put(key, ['x' * 30])
+        age(tmp_path / f'{key}.json', ord('z') - ord(key))
+    assert sum(os.path.getsize(tmp_path / f'{key}.json') for key in stored(tmp_path)) <= 100
+    assert stored(tmp_path)[-1] == 'e'
+
+
+def test_expired_entries_are_removed_from_the_directory(tmp_path):
+    cache = ResponseCache(ttl=60, directory=str(tmp_path))
+    cache.put('old', ['one'])
+    age(tmp_path / 'old.json', 120)
+    # Left behind by a write that crashed before its rename
+    (tmp_path / 'crashed.tmp').write_text('{')
+    age(tmp_path / 'crashed.tmp', 120)
+    cache.put('new', ['two'])
+    assert os.listdir(tmp_path) == ['new.json']
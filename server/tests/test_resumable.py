@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from generation import InvalidRequest
+from resumable import StreamExpired, StreamRegistry, UnknownStream, last_event_id
+
+
+def events(count):
+    for seq in range(1, count + 1):
+        yield {'seq': seq, 'type': 'delta', 'section': 'html', 'text': str(seq)}
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def finished(stream):
+    wait_for(lambda: stream.finished)
+    return stream
+
+
+def seqs(following):
+    return [event['seq'] for event in following]
+
+
+def test_follow_replays_after_last_event_id():
+    stream = finished(StreamRegistry().open(events(5)))
+    assert seqs(stream.follow()) == [1, 2, 3, 4, 5]
+    assert seqs(stream.follow(3)) == [4, 5]
+    assert seqs(stream.follow(5)) == []
+
+
+def test_events_already_dropped_from_the_ring_are_gone():
+    stream = finished(StreamRegistry(capacity=3).open(events(5)))
+    assert seqs(stream.follow(2)) == [3, 4, 5]
+    with pytest.raises(StreamExpired):
+        stream.follow(1)
+
+
+def test_registry_finds_open_streams_only():
+    streams = StreamRegistry()
+    stream = streams.open(events(1))
+    assert streams.get(stream.stream_id) is stream
+    with pytest.raises(UnknownStream):
+        streams.get('missing')
+
+
+def test_closing_a_follower_from_another_thread_detaches_it():
+    upstream = threading.Event()
+
+    def quiet():
+        yield {'seq': 1, 'type': 'delta', 'section': 'html', 'text': 'x'}
+        upstream.wait(2)
+
+    stream = StreamRegistry().open(quiet())
+    following = stream.follow(1)
+    # The encoder's reader thread, waiting for an event that isn't coming
+    reader = threading.Thread(target=lambda: list(following))
+    reader.start()
+    wait_for(lambda: stream.attached == 1)
+    following.close()
+    reader.join(1)
+    assert not reader.is_alive() and stream.attached == 0
+    upstream.set()
+
+
+def test_last_event_id_header():
+    assert last_event_id(None) == 0
+    assert last_event_id('12') == 12
+    with pytest.raises(InvalidRequest):
+        last_event_id('twelve')
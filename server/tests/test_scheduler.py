@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+from resumable import StreamRegistry
+from scheduler import Overloaded, Scheduler, admitted_events, client_id
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def test_client_leaving_while_queued_never_opens_the_generation():
+    scheduler = Scheduler(max_active=1)
+    scheduler.poll_interval = 0.01
+    running = scheduler.admit('a')
+    queued = scheduler.admit('b')
+    opened = []
+
+    def open_events():
+        opened.append(True)
+        return iter([])
+
+    stream = StreamRegistry(grace=0.05).open(admitted_events(scheduler, queued, open_events))
+    queued.abandoned = stream.abandoned
+    # Nobody follows the stream, as when the client drops after 'queued'
+    wait_for(lambda: stream.finished)
+
+    assert [event['type'] for event in stream.buffer] == ['queued']
+    assert queued.released and scheduler.queued == 0
+    scheduler.release(running)
+    assert scheduler.active == 0
+    assert opened == []
+
+
+def test_client_is_the_peer_unless_proxies_are_trusted():
+    assert client_id('1.2.3.4', '10.0.0.9') == '10.0.0.9'
+    assert client_id(None, '10.0.0.9') == '10.0.0.9'
+
+
+def test_client_is_the_hop_the_trusted_proxies_appended():
+    # The browser made up the first entry; our proxy appended the second
+    assert client_id('6.6.6.6, 1.2.3.4', '10.0.0.1', trusted_proxies=1) == '1.2.3.4'
+    assert client_id('6.6.6.6, 1.2.3.4, 10.0.0.2', '10.0.0.1', trusted_proxies=2) == '1.2.3.4'
+    assert client_id('1.2.3.4', '10.0.0.1', trusted_proxies=2) == '1.2.3.4'
+
+
+def test_lanes_are_served_round_robin():
+    scheduler = Scheduler(max_active=1, max_per_client=4)
+    running = scheduler.admit('a')
+    a1, a2, b1 = scheduler.admit('a'), scheduler.admit('a'), scheduler.admit('b')
+    assert [scheduler.position(ticket) for ticket in (a1, b1, a2)] == [1, 2, 3]
+
+    scheduler.release(running)
+    assert a1.granted and not b1.granted
+    # b's lane is served before a's second request
+    scheduler.release(a1)
+    assert b1.granted and not a2.granted
+    scheduler.release(b1)
+    assert a2.granted
+
+
+def test_per_client_limit_queues_even_with_free_slots():
+    scheduler = Scheduler(max_active=4, max_per_client=1)
+    first = scheduler.admit('a')
+    second = scheduler.admit('a')
+    other = scheduler.admit('b')
+    assert first.granted and other.granted and not second.granted
+    scheduler.release(first)
+    assert second.granted
+
+
+def test_full_queue_is_refused_with_retry_after():
+    scheduler = Scheduler(max_active=1, max_queued=1, retry_after=7)
+    scheduler.admit('a')
+    scheduler.admit('b')
+    with pytest.raises(Overloaded) as refused:
+        scheduler.admit('c')
+    assert refused.value.retry_after == 7
+    assert scheduler.queued == 1
+
+
+def test_queued_events_come_before_the_generation():
+    scheduler = Scheduler(max_active=1)
+    running = scheduler.admit('a')
+    events = admitted_events(scheduler, scheduler.admit('b'), lambda: iter([{'seq': 1, 'type': 'done'}]))
+    assert next(events) == {'seq': 1, 'type': 'queued', 'position': 1}
+    scheduler.release(running)
+    assert list(events) == [{'seq': 2, 'type': 'done'}]
+    assert scheduler.active == 0
@@ -0,0 +1,74 @@
+import pytest
+
+from section_parser import SectionStreamParser
+
+RESPONSE = '''Here is your site:
+
+```html
+<h1>Hi</h1>
+<pre>```not a fence</pre>
+```
+
+```css
+h1 { color: red; }
+```
+
+```javascript
+console.log(`a`)
+```
+Done.
+'''
+
+
+def sections(events):
+    result = {}
+    for event in events:
+        if event['type'] == 'delta':
+            result[event['section']] = result.get(event['section'], '') + event['text']
+    return result
+
+
+def parse(chunks):
+    parser = SectionStreamParser()
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    return events + parser.close()
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, len(RESPONSE)])
+def test_any_chunking_gives_the_same_sections(size):
+    events = parse(RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size))
+    assert sections(events) == {
+        'html': '<h1>Hi</h1>\n<pre>```not a fence</pre>',
+        'css': 'h1 { color: red; }',
+        'js': 'console.log(`a`)',
+    }
+    assert [event['seq'] for event in events] == list(range(1, len(events) + 1))
+    assert [event['section'] for event in events if event['type'] == 'section_end'] == ['html', 'css', 'js']
+    assert events[-1]['type'] == 'done'
+
+
+def test_only_the_first_block_of_each_kind_is_used():
+    events = parse(['```css\na {}\n```\n```python\nx = 1\n```\n```css\nb {}\n```\n'])
+    assert sections(events) == {'css': 'a {}'}
+
+
+def test_close_flushes_an_unterminated_block():
+    parser = SectionStreamParser()
+    events = parser.feed('```html\n<p>cut off') + parser.close()
+    assert sections(events) == {'html': '<p>cut off'}
+    assert [event['type'] for event in events][-2:] == ['section_end', 'done']
+
+
+def test_text_that_might_start_a_fence_is_held_back():
+    parser = SectionStreamParser()
+    assert sections(parser.feed('```html\nab\n`')) == {'html': 'ab'}
+    assert sections(parser.feed('`x')) == {'html': '\n``x'}
+
+
+def test_feed_after_close_raises():
+    parser = SectionStreamParser()
+    parser.close()
+    with pytest.raises(ValueError):
+        parser.feed('more')
@@ -0,0 +1,59 @@
+from projects import MemoryProjectStore
+from similar_prompts import MIN_RECALL, SimilarPrompts, candidate_probability, lsh_shape
+
+
+def test_shape_finds_descriptions_at_the_threshold():
+    bands, rows = lsh_shape(64, 0.8)
+    assert (bands, rows) == (16, 4)
+    assert candidate_probability(0.8, bands, rows) >= MIN_RECALL
+
+
+def test_lookup_matches_at_exactly_the_threshold():
+    # Four of five words kept is a Jaccard similarity of exactly 0.8
+    found = 0
+    for number in range(200):
+        words = [f'word{number}x{i}' for i in range(5)]
+        index = SimilarPrompts(threshold=0.8)
+        index.add(' '.join(words), f'{number:032x}', '0' * 16)
+        found += index.lookup(' '.join(words[:4])) is not None
+    assert found >= 196
+
+
+def test_crowded_buckets_still_check_the_closest_candidates():
+    common = ' '.join(f'common{i}' for i in range(20))
+    index = SimilarPrompts(threshold=0.8)
+    index.add(f'{common} target', 'target'.ljust(32, '0'), '0' * 16)
+    # Hundreds of newer descriptions sharing most of its words and bands
+    for number in range(400):
+        index.add(f'{common} other{number}', f'{number:032x}', '0' * 16)
+    (_, _, project_id, _), similarity = index.lookup(f'target {common}')
+    assert project_id == 'target'.ljust(32, '0') and similarity == 1.0
+
+
+SITE = {'html': '<h1>Coffee</h1>', 'css': 'h1 {}', 'js': ''}
+
+
+def test_index_keeps_the_most_recent_entries_on_disk_too(tmp_path):
+    path = tmp_path / 'similar.jsonl'
+    index = SimilarPrompts(path=str(path), max_entries=2)
+    for number in range(7):
+        index.add(f'bakery number{number} landing page', f'{number:032x}', '0' * 16)
+    assert len(index) == 2
+    assert index.lookup('bakery number0 landing page') is None
+    assert len(path.read_text().splitlines()) <= 4
+
+    reloaded = SimilarPrompts(path=str(path), max_entries=2)
+    assert reloaded.lookup('bakery number6 landing page') is not None
+    assert reloaded.lookup('bakery number4 landing page') is None
+
+
+def test_find_skips_matches_whose_project_is_gone():
+    store = MemoryProjectStore(max_projects=1)
+    index = SimilarPrompts(threshold=0.5)
+    # The closest match, but its project is dropped when the next is saved
+    index.add('coffee shop landing page', *store.create(SITE))
+    index.add('coffee shop landing page dark', *store.create(SITE))
+
+    reuse = index.find('coffee shop landing page', store)
+    assert reuse is not None and reuse.match == 'coffee shop landing page dark'
+    assert len(index) == 1
@@ -12,6 +12,7 @@ const LiveRenderer = ({ toggleMode, isLightMode }) => {
   const [htmlCode, setHtmlCode] = useState(() => localStorage.getItem('htmlCode') || '');
   const [cssCode, setCssCode] = useState(() => localStorage.getItem('cssCode') || '');
   const [jsCode, setJsCode] = useState(() => localStorage.getItem('jsCode') || '');
+  const [project, setProject] = useState(() => JSON.parse(localStorage.getItem('project') || 'null'));
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState(null);
 
@@ -23,7 +24,8 @@ const LiveRenderer = ({ toggleMode, isLightMode }) => {
     localStorage.setItem('htmlCode', htmlCode);
     localStorage.setItem('cssCode', cssCode);
     localStorage.setItem('jsCode', jsCode);
-  }, [userInput, modifyInput, htmlCode, cssCode, jsCode]);
+    localStorage.setItem('project', JSON.stringify(project));
+  }, [userInput, modifyInput, htmlCode, cssCode, jsCode, project]);
 
   const handleGenerateWebsite = useCallback(async () => {
     if (!userInput.trim()) {
@@ -35,14 +37,16 @@ const LiveRenderer = ({ toggleMode, isLightMode }) => {
     setHtmlCode('');
     setCssCode('');
     setJsCode('');
+    setProject(null);
 
     try {
-      await generateWebsite(userInput, ({ html, css, js }) => {
+      const savedProject = await generateWebsite(userInput, ({ html, css, js }) => {
         console.log('Received update:', { html, css, js });
         if (html) setHtmlCode(html);
         if (css) setCssCode(css);
         if (js) setJsCode(js);
       });
+      setProject(savedProject);
     } catch (err) {
       setError('Failed to generate website: ' + err.message);
       console.error('Error generating website:', err);
@@ -64,11 +68,12 @@ const LiveRenderer = ({ toggleMode, isLightMode }) => {
     setError(null);
 
     try {
-      await modifyWebsite(modifyInput, htmlCode, cssCode, jsCode, ({ html, css, js }) => {
+      const savedProject = await modifyWebsite(modifyInput, htmlCode, cssCode, jsCode, ({ html, css, js }) => {
         if (html) setHtmlCode(html);
         if (css) setCssCode(css);
         if (js) setJsCode(js);
-      });
+      }, project);
+      setProject(savedProject);
     } catch (err) {
       console.error('Error details:', err);
       setError(err.response?.data?.error || 'Failed to modify website. Please try again.');
@@ -76,7 +81,7 @@ const LiveRenderer = ({ toggleMode, isLightMode }) => {
     } finally {
       setIsLoading(false);
     }
-  }, [modifyInput, htmlCode, cssCode, jsCode]);
+  }, [modifyInput, htmlCode, cssCode, jsCode, project]);
 
   const handleClear = () => {
     // Clear all stored data
@@ -85,6 +90,7 @@ const LiveRenderer = ({ toggleMode, isLightMode }) => {
     localStorage.removeItem('htmlCode');
     localStorage.removeItem('cssCode');
     localStorage.removeItem('jsCode');
+    localStorage.removeItem('project');
     
     // Reset state
     setUserInput('');
@@ -92,6 +98,7 @@ const LiveRenderer = ({ toggleMode, isLightMode }) => {
     setHtmlCode('');
     setCssCode('');
     setJsCode('');
+    setProject(null);
     setError(null);
   };
 
@@ -151,7 +158,7 @@ const LiveRenderer = ({ toggleMode, isLightMode }) => {
           <h2>LIVE PREVIEW</h2>
           <div className="preview-actions">
             <button
-              onClick={() => downloadCodeAsZip(htmlCode, cssCode, jsCode)}
+              onClick={() => downloadCodeAsZip(htmlCode, cssCode, jsCode, project)}
               className="download-button"
               disabled={!htmlCode}
               title="Download code as ZIP"
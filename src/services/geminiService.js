@@ -10,6 +10,95 @@ if (process.env.NODE_ENV === 'production') {
 
 console.log('Using backend URL:', BACKEND_URL);
 
+// REACT_APP_GENERATION_MODE=sectioned has the server plan the site first and
+// then write the HTML, CSS and JS concurrently
+const GENERATION_MODE = process.env.REACT_APP_GENERATION_MODE;
+
+// Read the server's typed SSE events ({ seq, type, section, text }) from one
+// response. Lines can be split across reads, so keep the tail.
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let pending = '';
+
+  const handleLine = (line) => {
+    if (!line.startsWith('data: ')) return;
+    const event = JSON.parse(line.slice(6));
+    if (event.type === 'error') {
+      throw new Error(event.error);
+    }
+    onEvent(event);
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+
+    pending += decoder.decode(value, { stream: true });
+    const lines = pending.split('\n');
+    pending = lines.pop();
+
+    for (const line of lines) {
+      handleLine(line);
+    }
+  }
+
+  pending += decoder.decode();
+  if (pending) handleLine(pending);
+}
+
+const RESUME_ATTEMPTS = 3;
+
+// Hand each section event to onEvent. If the connection drops before the done
+// event and the server named the stream (X-Stream-Id), reconnect with
+// Last-Event-ID and carry on from the last event seen instead of failing; the
+// generation keeps running on the server in the meantime.
+async function readSectionEvents(response, onEvent) {
+  const streamId = response.headers.get('X-Stream-Id');
+  let lastSeq = 0;
+  let finished = false;
+
+  const handleEvent = (event) => {
+    if (event.seq <= lastSeq) return;
+    lastSeq = event.seq ?? lastSeq;
+    if (event.type === 'done') finished = true;
+    if (event.type === 'queued') {
+      // Waiting for a generation slot on the server; nothing to render yet
+      console.log('Queued for generation at position', event.position);
+    }
+    onEvent(event);
+  };
+
+  for (let attempt = 0; ; attempt++) {
+    try {
+      if (attempt > 0) {
+        await new Promise((resolve) => setTimeout(resolve, 500 * attempt));
+        console.log(`Resuming stream ${streamId} after event ${lastSeq}`);
+        response = await fetch(`${BACKEND_URL}/api/streams/${streamId}`, {
+          headers: { 'Last-Event-ID': String(lastSeq) },
+        });
+        if (!response.ok) {
+          throw new Error(`Could not resume the stream: ${response.status}`);
+        }
+      }
+      await readEventStream(response, handleEvent);
+      if (finished) return;
+      if (!streamId || attempt >= RESUME_ATTEMPTS) {
+        // Out of retries; a site without its done event is truncated
+        throw new Error('The stream ended before the website was complete');
+      }
+    } catch (error) {
+      // fetch reports dropped connections as TypeErrors; anything else is a
+      // real failure (an error event, an expired stream) and isn't retried
+      if (!streamId || !(error instanceof TypeError) || attempt >= RESUME_ATTEMPTS) {
+        throw error;
+      }
+    }
+  }
+}
+
+const SECTIONS = ['html', 'css', 'js'];
+
 export async function generateWebsite(description, onUpdate) {
   try {
     const response = await fetch(`${BACKEND_URL}/api/generate-website`, {
@@ -17,70 +106,49 @@ export async function generateWebsite(description, onUpdate) {
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ description }),
+      body: JSON.stringify({ description, mode: GENERATION_MODE }),
     });
 
+    if (response.status === 429) {
+      const retryAfter = response.headers.get('Retry-After') || 'a few';
+      throw new Error(`The server is busy, try again in ${retryAfter} seconds`);
+    }
     if (!response.ok) {
       throw new Error('Network response was not ok');
     }
 
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder();
-    let accumulatedText = '';
+    // Deltas are appended as they arrive instead of re-parsing the whole text
+    const sections = { html: '', css: '', js: '' };
     let lastUpdate = { html: '', css: '', js: '' };
+    let project = null;
 
-    while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
-
-      const chunk = decoder.decode(value);
-      const lines = chunk.split('\n');
-
-      for (const line of lines) {
-        if (line.startsWith('data: ')) {
-          const data = JSON.parse(line.slice(6));
-          const { text } = data;
-          
-          // Accumulate the text
-          accumulatedText += text;
-          
-          // Extract HTML, CSS, and JavaScript from the accumulated response
-          const htmlMatch = accumulatedText.match(/```html\n([\s\S]*?)\n```/);
-          const cssMatch = accumulatedText.match(/```css\n([\s\S]*?)\n```/);
-          const jsMatch = accumulatedText.match(/```javascript\n([\s\S]*?)\n```/);
-
-          const update = {
-            html: htmlMatch ? htmlMatch[1].trim() : lastUpdate.html,
-            css: cssMatch ? cssMatch[1].trim() : lastUpdate.css,
-            js: jsMatch ? jsMatch[1].trim() : lastUpdate.js
-          };
-
-          // Only update if there are actual changes
-          if (update.html !== lastUpdate.html || 
-              update.css !== lastUpdate.css || 
-              update.js !== lastUpdate.js) {
-            console.log('New update:', update);
-            lastUpdate = update;
-            onUpdate(update);
-          }
+    await readSectionEvents(response, (event) => {
+      if (event.type === 'done') {
+        project = { projectId: event.projectId, revision: event.revision };
+        if (event.similarTo) {
+          console.log('Reused the site generated for a similar description:', event.similarTo);
         }
       }
-    }
-
-    // Final update with complete code
-    const finalHtmlMatch = accumulatedText.match(/```html\n([\s\S]*?)\n```/);
-    const finalCssMatch = accumulatedText.match(/```css\n([\s\S]*?)\n```/);
-    const finalJsMatch = accumulatedText.match(/```javascript\n([\s\S]*?)\n```/);
+      if (event.type === 'delta') {
+        sections[event.section] += event.text;
+      }
+      if (event.type !== 'delta' && event.type !== 'section_end') return;
 
-    if (finalHtmlMatch || finalCssMatch || finalJsMatch) {
-      const finalUpdate = {
-        html: finalHtmlMatch ? finalHtmlMatch[1].trim() : lastUpdate.html,
-        css: finalCssMatch ? finalCssMatch[1].trim() : lastUpdate.css,
-        js: finalJsMatch ? finalJsMatch[1].trim() : lastUpdate.js
+      const update = {
+        html: sections.html.trim(),
+        css: sections.css.trim(),
+        js: sections.js.trim()
       };
-      console.log('Final update:', finalUpdate);
-      onUpdate(finalUpdate);
-    }
+
+      // Only update if there are actual changes
+      if (SECTIONS.some((section) => update[section] !== lastUpdate[section])) {
+        lastUpdate = update;
+        onUpdate(update);
+      }
+    });
+
+    console.log('Final update:', lastUpdate);
+    return project;
 
   } catch (error) {
     console.error('Error calling backend API:', error);
@@ -88,7 +156,10 @@ export async function generateWebsite(description, onUpdate) {
   }
 }
 
-export async function modifyWebsite(modificationDescription, currentHtml, currentCss, currentJs, onUpdate) {
+// `project` is the { projectId, revision } returned by the previous generation
+// or modification. With it only the instruction is sent; the server applies it
+// to its stored copy of that revision.
+export async function modifyWebsite(modificationDescription, currentHtml, currentCss, currentJs, onUpdate, project) {
   try {
     // Validate inputs before sending
     if (!modificationDescription?.trim()) {
@@ -103,20 +174,45 @@ export async function modifyWebsite(modificationDescription, currentHtml, curren
       modificationDescription: modificationDescription.trim(),
       currentHtml: currentHtml.trim(),
       currentCss: currentCss?.trim() || '',
-      currentJs: currentJs?.trim() || ''
+      currentJs: currentJs?.trim() || '',
+      // Ask for SEARCH/REPLACE edits; the server falls back to a full
+      // regeneration if they don't apply
+      mode: 'patch'
     };
 
-    console.log('Sending modification request to:', `${BACKEND_URL}/api/modify-website`);
-    console.log('Request payload:', payload);
+    const sendModifyRequest = (body) => {
+      console.log('Sending modification request to:', `${BACKEND_URL}/api/modify-website`);
+      console.log('Request payload:', body);
 
-    const response = await fetch(`${BACKEND_URL}/api/modify-website`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-        'Accept': 'text/event-stream',
-      },
-      body: JSON.stringify(payload),
-    });
+      return fetch(`${BACKEND_URL}/api/modify-website`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(body),
+      });
+    };
+
+    let response;
+    if (project?.projectId) {
+      response = await sendModifyRequest({
+        modificationDescription: payload.modificationDescription,
+        projectId: project.projectId,
+        baseRevision: project.revision,
+        mode: payload.mode
+      });
+
+      // Unknown project (e.g. a restarted server) or a newer revision saved
+      // elsewhere: upload our copy instead, which starts a new project rather
+      // than overwriting the other one
+      if (response.status === 404 || response.status === 409) {
+        console.log('Stored project unavailable, uploading the current code');
+        response = await sendModifyRequest(payload);
+      }
+    } else {
+      response = await sendModifyRequest(payload);
+    }
 
     console.log('Response status:', response.status);
     console.log('Response headers:', Object.fromEntries(response.headers.entries()));
@@ -133,57 +229,54 @@ export async function modifyWebsite(modificationDescription, currentHtml, curren
       }
     }
 
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder();
-    let accumulatedText = '';
+    // Sections replace the current code only once they are complete, so the
+    // working site is never swapped for a half-written one
+    const sections = { html: '', css: '', js: '' };
     let lastUpdate = { html: currentHtml, css: currentCss, js: currentJs };
+    let updatedProject = null;
 
-    while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
-
-      const chunk = decoder.decode(value);
-      const lines = chunk.split('\n');
-
-      for (const line of lines) {
-        if (!line.trim()) continue;
-        
-        if (line.startsWith('data: ')) {
-          try {
-            const data = JSON.parse(line.slice(6));
-            const { text } = data;
-            
-            // Accumulate the text
-            accumulatedText += text;
-            
-            // Extract HTML, CSS, and JavaScript from the accumulated response
-            const htmlMatch = accumulatedText.match(/```html\n([\s\S]*?)\n```/);
-            const cssMatch = accumulatedText.match(/```css\n([\s\S]*?)\n```/);
-            const jsMatch = accumulatedText.match(/```javascript\n([\s\S]*?)\n```/);
-
-            const update = {
-              html: htmlMatch ? htmlMatch[1].trim() : lastUpdate.html,
-              css: cssMatch ? cssMatch[1].trim() : lastUpdate.css,
-              js: jsMatch ? jsMatch[1].trim() : lastUpdate.js
-            };
-
-            // Only update if there are actual changes
-            if (update.html !== lastUpdate.html || 
-                update.css !== lastUpdate.css || 
-                update.js !== lastUpdate.js) {
-              console.log('New update:', update);
-              lastUpdate = { ...update };
-              onUpdate(update);
-            }
-          } catch (parseError) {
-            console.error('Error parsing SSE data:', parseError);
-            continue;
-          }
-        }
+    await readSectionEvents(response, (event) => {
+      if (event.type === 'done') {
+        updatedProject = { projectId: event.projectId, revision: event.revision };
+        return;
       }
-    }
+      if (event.type === 'delta') {
+        sections[event.section] += event.text;
+        return;
+      }
+      if (event.type !== 'section_end') return;
+
+      const update = { ...lastUpdate, [event.section]: sections[event.section].trim() };
+      if (update[event.section] !== lastUpdate[event.section]) {
+        console.log('New update:', update);
+        lastUpdate = update;
+        onUpdate(update);
+      }
+    });
+
+    return updatedProject;
   } catch (error) {
     console.error('Error in modifyWebsite:', error);
     throw error;
   }
-}
\ No newline at end of file
+}
+// The project's export ZIP, minified (and with unused CSS rules dropped) on
+// the server and cached there per revision. Resolves to null when there is no
+// saved project or the server can't export it, so the caller can zip the code
+// itself instead.
+export async function exportProject(project, { inline = false } = {}) {
+  if (!project?.projectId) return null;
+
+  const params = new URLSearchParams({ revision: project.revision, inline: inline ? '1' : '0' });
+  try {
+    const response = await fetch(`${BACKEND_URL}/api/projects/${project.projectId}/export?${params}`);
+    if (!response.ok) {
+      console.warn('Project export failed with status', response.status);
+      return null;
+    }
+    return await response.blob();
+  } catch (error) {
+    console.warn('Project export failed:', error);
+    return null;
+  }
+}
@@ -1,7 +1,16 @@
 import JSZip from 'jszip';
 import { saveAs } from 'file-saver';
+import { exportProject } from '../services/geminiService';
+
+export const downloadCodeAsZip = async (htmlCode, cssCode, jsCode, project) => {
+  // Saved projects are minified and zipped by the server, which keeps the
+  // result per revision; the browser only zips the raw code as a fallback
+  const exported = await exportProject(project);
+  if (exported) {
+    saveAs(exported, "website-code.zip");
+    return;
+  }
 
-export const downloadCodeAsZip = (htmlCode, cssCode, jsCode) => {
   const zip = new JSZip();
 
   // Add files to zip
@@ -10,8 +19,6 @@ export const downloadCodeAsZip = (htmlCode, cssCode, jsCode) => {
   zip.file("script.js", jsCode);
 
   // Generate and download zip
-  zip.generateAsync({ type: "blob" })
-    .then(function(content) {
-      saveAs(content, "website-code.zip");
-    });
-}; 
\ No newline at end of file
+  const content = await zip.generateAsync({ type: "blob" });
+  saveAs(content, "website-code.zip");
+};